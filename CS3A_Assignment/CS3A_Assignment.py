@@ -9,8 +9,28 @@ and then provides a selection menu for a user to choose from.
 """
 
 # Imports
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
 from enum import Enum
+from functools import lru_cache, partial, wraps
+from itertools import accumulate, repeat
+import bz2
+import contextlib
 import csv
+import gzip
+import heapq
+import io
+import json
+import math
+import mmap
+import numbers
+import os
+import re
+import struct
+import sys
+import threading
+import time
 
 
 conversions = {
@@ -25,6 +45,980 @@ conversions = {
 }
 
 home_currency = ""
+# (conversions items, currencies, rates, positions), built by rate_matrix().
+_rate_matrix = None
+
+
+@lru_cache(maxsize=None)
+def _numpy():
+    """Returns the numpy module, imported on first use so that starting the
+    program does not wait for it, or None if it is not installed."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+DEFAULT_DATA_FILE = 'AB_NYC_2019.csv'
+# Positions of the location, property type and price fields in each CSV row.
+DEFAULT_COLUMNS = (1, 2, 3)
+# Position of the listing id in AB_NYC_2019.csv.
+DEFAULT_ID_COLUMN = 0
+# Most and least expensive listings kept per (location, property type) pair.
+DEFAULT_LISTING_COUNT = 10
+DEFAULT_CHUNK_SIZE = 10000
+# Parsed copies of a CSV file are cached next to it under this suffix.
+CACHE_SUFFIX = '.cache'
+_CACHE_MAGIC = b'DSCACHE2'
+# Bytes of an uncompressed file that DataSet.scan_file splits at a time:
+# about 7000 rows of AB_NYC_2019.csv, so a load reports progress as often
+# as the chunked reader does, and no slower to scan than larger blocks.
+DEFAULT_BLOCK_SIZE = 1 << 18
+# Where ReportService listens by default.
+DEFAULT_SERVICE_HOST = '127.0.0.1'
+DEFAULT_SERVICE_PORT = 8765
+# A CSV field: either quoted, with "" escaping a quote and commas or line
+# breaks allowed inside, or a run of characters with none of those.
+_FIELD_PATTERN = rb'("(?:[^"]|"")*"|[^,"\r\n]*)'
+
+
+def _decode_field(value: bytes):
+    """Returns the text of a raw CSV field, unquoting a quoted one."""
+    if value[:1] == b'"':
+        value = value[1:-1].replace(b'""', b'"')
+    return value.decode('utf-8')
+
+
+def _check_price_bounds(*bounds):
+    """Raises ValueError unless every bound is None or a real number other
+    than a bool or NaN, which could not be compared with the prices."""
+    for bound in bounds:
+        if bound is not None and (isinstance(bound, bool) or
+                                  not isinstance(bound, numbers.Real) or math.isnan(bound)):
+            raise ValueError(f"A price bound must be a number, not {bound!r}")
+
+
+def _block_columns(block: bytes, width: int, positions):
+    """Returns the fields at positions of every line of block, a run of
+    lines ending in LF or CRLF without quotes, as one (values, codes) pair
+    per position, or None if a line does not hold width comma separated
+    fields or a carriage return is not followed by a line feed.
+
+    With NumPy, the fields are told apart by their length and their bytes
+    read as 8-byte words, so only the distinct values are sliced out of
+    block, in order of first appearance, and codes is an ndarray of the
+    index of each line's value. Without it, block is split into one flat
+    list of fields, values holds the field of every line and codes is None.
+    """
+    np = _numpy()
+    if np is None:
+        if block.count(b'\r') != block.count(b'\r\n'):
+            return None
+        block = block.replace(b'\r\n', b'\n')
+        if set(map(bytes.count, block.split(b'\n'), repeat(b','))) != {width - 1}:
+            return None
+        fields = block.replace(b'\n', b',').split(b',')
+        return [(fields[position::width], None) for position in positions]
+    characters = np.frombuffer(block, dtype=np.uint8)
+    line_feeds = characters == ord('\n')
+    carriage_returns = np.flatnonzero(characters == ord('\r'))
+    if not line_feeds[np.minimum(carriage_returns + 1, len(characters) - 1)].all():
+        return None
+    separators = np.flatnonzero((characters == ord(',')) | line_feeds)
+    if (len(separators) + 1) % width:
+        return None
+    line_ends = separators[width - 1::width]
+    if len(line_ends) != np.count_nonzero(line_feeds) or \
+            not line_feeds[line_ends].all():
+        return None
+    ends = np.append(separators, len(characters)).reshape(-1, width)
+    # The last field of a CRLF line ends before the CR.
+    ends[:, -1] -= characters[ends[:, -1] - 1] == ord('\r')
+    starts = np.append(0, separators + 1).reshape(-1, width)
+    padded = np.zeros(len(characters) + 8, dtype=np.uint8)
+    padded[:len(characters)] = characters
+    # The little-endian word of the 8 bytes starting at each offset.
+    words = np.ndarray((len(characters) + 1,), dtype='<u8', buffer=padded, strides=(1,))
+    masks = np.array([(1 << 8 * count) - 1 for count in range(9)], dtype=np.uint64)
+    columns = []
+    for position in positions:
+        column_starts, column_ends = starts[:, position], ends[:, position]
+        lengths = column_ends - column_starts
+        keys = [lengths] + [words[np.minimum(column_starts + offset, len(characters))] &
+                            masks[np.clip(lengths - offset, 0, 8)]
+                            for offset in range(0, int(lengths.max()), 8)]
+        order = np.lexsort(keys)
+        distinct = np.zeros(len(order), dtype=bool)
+        distinct[0] = True
+        for key in keys:
+            ordered = key[order]
+            distinct[1:] |= ordered[1:] != ordered[:-1]
+        firsts = order[distinct]
+        # Number the distinct values by their first line rather than by the sort.
+        numbers = np.empty(len(firsts), dtype=np.int64)
+        numbers[np.argsort(firsts)] = np.arange(len(firsts))
+        codes = np.empty(len(order), dtype=np.int64)
+        codes[order] = numbers[np.cumsum(distinct) - 1]
+        firsts.sort()
+        columns.append(([block[start:end] for start, end
+                         in zip(column_starts[firsts].tolist(), column_ends[firsts].tolist())],
+                        codes))
+    return columns
+
+
+class _ReadWriteLock(object):
+    """Lets any number of threads read at once, or one thread write.
+
+    Writers are preferred: once a writer is waiting, new readers wait for it,
+    so a steady stream of reports cannot starve a filter toggle or load. Both
+    sides are reentrant per thread, and a writer may also read, but a thread
+    holding only a read lock cannot upgrade it to a write lock.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._waiting_writers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._local = threading.local()
+
+    def acquire_read(self, blocking=True):
+        """Take the read lock and return True, or, without blocking,
+        return False instead of waiting for a writer."""
+        depth = getattr(self._local, "depth", 0)
+        if depth or self._writer == threading.get_ident():
+            self._local.depth = depth + 1
+            return True
+        with self._condition:
+            while self._writer is not None or self._waiting_writers:
+                if not blocking:
+                    return False
+                self._condition.wait()
+            self._readers += 1
+        self._local.depth = 1
+        self._local.counted = True
+        return True
+
+    def release_read(self):
+        self._local.depth -= 1
+        if self._local.depth == 0 and getattr(self._local, "counted", False):
+            self._local.counted = False
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            self._writer_depth += 1
+            return
+        if getattr(self._local, "depth", 0):
+            raise RuntimeError("Cannot upgrade a read lock to a write lock")
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        self._writer_depth -= 1
+        if self._writer_depth == 0:
+            with self._condition:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def reading(self):
+        """Context manager holding the read lock for its body."""
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def writing(self):
+        """Context manager holding the write lock for its body."""
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def _reads(method):
+    """Run a DataSet method under its read lock."""
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        self._lock.acquire_read()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._lock.release_read()
+    return locked
+
+
+def _writes(method):
+    """Run a DataSet method under its write lock, so readers see either all
+    of its changes or none of them."""
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        self._lock.acquire_write()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._lock.release_write()
+    return locked
+
+
+class _Measurement(object):
+    """What an instrumented operation reports about itself beyond its time."""
+    __slots__ = ("rows",)
+
+    def __init__(self):
+        self.rows = 0
+
+
+class OperationStats(object):
+    """Totals of one instrumented operation."""
+    __slots__ = ("calls", "seconds", "rows", "cache_hits", "cache_misses", "peak_bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.peak_bytes = None
+
+
+class Instrumentation(object):
+    """Collects an OperationStats per operation name while attached to a
+    DataSet with DataSet.enable_instrumentation().
+
+    Each operation records its wall time, the data rows it read, the result
+    cache hits and misses of its DataSet and, with memory, the tracemalloc
+    peak of the memory allocated since it started. Nested operations are
+    timed too, but the peak memory and the cProfile profile (with profile)
+    only cover the outermost operation of a thread. Both measures are
+    process wide, so they include the work of other threads running at the
+    same time.
+    """
+
+    def __init__(self, memory=False, profile=False):
+        self.stats = {}
+        self.memory = memory
+        if profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+        else:
+            self._profiler = None
+        self._profiler_lock = threading.Lock()
+        self._started_tracing = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def operation(self, name: str, dataset=None):
+        """Measure the body of the with statement as one call of name. Yields
+        a _Measurement on which the body can set the rows it read."""
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        outermost = depth == 0
+        if self.memory:
+            import tracemalloc
+        if outermost and self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        profiling = outermost and self._profiler is not None and \
+            self._profiler_lock.acquire(blocking=False)
+        if profiling:
+            self._profiler.enable()
+        if dataset is not None:
+            hits, misses = dataset._result_hits, dataset._result_misses
+        measurement = _Measurement()
+        start = time.perf_counter()
+        try:
+            yield measurement
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiling:
+                self._profiler.disable()
+                self._profiler_lock.release()
+            peak = tracemalloc.get_traced_memory()[1] - baseline \
+                if outermost and self.memory else None
+            self._local.depth = depth
+            with self._lock:
+                stats = self.stats.get(name)
+                if stats is None:
+                    stats = self.stats[name] = OperationStats()
+                stats.calls += 1
+                stats.seconds += elapsed
+                stats.rows += measurement.rows
+                if dataset is not None:
+                    stats.cache_hits += dataset._result_hits - hits
+                    stats.cache_misses += dataset._result_misses - misses
+                if peak is not None:
+                    stats.peak_bytes = max(peak, stats.peak_bytes or 0)
+
+    def close(self):
+        """Stop tracemalloc if this instrumentation started it."""
+        if self._started_tracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def report(self, out=None):
+        """Write a table of the operation totals to out (stdout by default),
+        slowest first."""
+        lines = [f"{'operation':28}{'calls':>8}{'total ms':>12}{'mean ms':>10}"
+                 f"{'rows':>10}{'hits':>7}{'misses':>7}{'peak MiB':>10}"]
+        with self._lock:
+            items = sorted(self.stats.items(), key=lambda item: -item[1].seconds)
+            for name, stats in items:
+                peak = '' if stats.peak_bytes is None else f"{stats.peak_bytes / 2 ** 20:.2f}"
+                lines.append(f"{name:28}{stats.calls:>8}{stats.seconds * 1000:>12.3f}"
+                             f"{stats.seconds * 1000 / stats.calls:>10.3f}{stats.rows:>10}"
+                             f"{stats.cache_hits:>7}{stats.cache_misses:>7}{peak:>10}")
+        (out or sys.stdout).write("\n".join(lines) + "\n")
+
+    def dump_profile(self, path=None, out=None, sort="cumulative", limit=25):
+        """Save the cProfile data to path for pstats or snakeviz, or without
+        a path write the limit top entries by sort to out. Requires profile."""
+        if self._profiler is None:
+            raise ValueError("Instrumentation was created without profile")
+        import pstats
+        if path is not None:
+            self._profiler.dump_stats(path)
+        else:
+            pstats.Stats(self._profiler, stream=out or sys.stdout).sort_stats(sort) \
+                .print_stats(limit)
+
+
+def _instrumented(name, rows=None):
+    """Measure a DataSet method as operation name while its DataSet has
+    instrumentation enabled. rows, if given, is called with the DataSet and
+    the method's result to count the data rows it read. Without
+    instrumentation this only costs an attribute check per call."""
+    def decorator(method):
+        @wraps(method)
+        def measured(self, *args, **kwargs):
+            instrumentation = self.instrumentation
+            if instrumentation is None:
+                return method(self, *args, **kwargs)
+            with instrumentation.operation(name, self) as measurement:
+                result = method(self, *args, **kwargs)
+                if rows is not None:
+                    measurement.rows = rows(self, result)
+                return result
+        return measured
+    return decorator
+
+
+def _loaded_rows(dataset, result):
+    return len(dataset._data) if dataset._data else 0
+
+
+def _returned_rows(dataset, result):
+    return result
+
+
+class _QuantileSketch(object):
+    """Mergeable quantile sketch with relative error guarantees, after
+    DDSketch (Masson, Rim and Lee, VLDB 2019).
+
+    Each positive value v is counted in bucket ceil(log(v) / log(gamma)),
+    with gamma = (1 + alpha) / (1 - alpha); values of zero or less share one
+    extra bucket. A quantile is read back as the midpoint of the bucket that
+    holds its rank, which is within a relative error of alpha (1%) of the
+    true value at that rank. Memory is bounded by the value range rather
+    than the number of values: positive prices up to P need at most
+    log(P) / log(gamma) + 1 buckets, about 700 for P = 1,000,000. Buckets
+    are plain counts, so sketches can be merged, and subtracted again,
+    exactly.
+    """
+    __slots__ = ("buckets", "zero_count", "count")
+    relative_accuracy = 0.01
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    log_gamma = math.log(gamma)
+
+    def __init__(self):
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    @staticmethod
+    @lru_cache(maxsize=1 << 16)
+    def _key(value):
+        return math.ceil(math.log(value) / _QuantileSketch.log_gamma)
+
+    def add(self, value, count=1):
+        """Count value, count times."""
+        if value > 0:
+            key = self._key(value)
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        else:
+            self.zero_count += count
+        self.count += count
+
+    def merge(self, other):
+        """Add the counts of another sketch to this one."""
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def subtract(self, other):
+        """Remove the counts of a sketch previously merged into this one."""
+        for key, count in other.buckets.items():
+            remaining = self.buckets[key] - count
+            if remaining:
+                self.buckets[key] = remaining
+            else:
+                del self.buckets[key]
+        self.zero_count -= other.zero_count
+        self.count -= other.count
+
+    def quantile(self, q: float):
+        """Returns the estimated value at quantile q (0 to 1), or None if empty."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class _Aggregate(object):
+    """Running minimum, sum, count and maximum of the prices in one group
+    of rows, plus a quantile sketch of them, so summary statistics can be
+    read without rescanning the data.
+    """
+    __slots__ = ("minimum", "total", "count", "maximum", "sketch")
+
+    def __init__(self):
+        self.minimum = None
+        self.total = 0
+        self.count = 0
+        self.maximum = None
+        self.sketch = _QuantileSketch()
+
+    def add(self, value: int):
+        """Fold a single price into the running totals."""
+        if self.count == 0:
+            self.minimum = self.maximum = value
+        elif value < self.minimum:
+            self.minimum = value
+        elif value > self.maximum:
+            self.maximum = value
+        self.total += value
+        self.count += 1
+        self.sketch.add(value)
+
+    def merge(self, other):
+        """Fold another group's totals into this one."""
+        if other.count == 0:
+            return
+        if self.count == 0 or other.minimum < self.minimum:
+            self.minimum = other.minimum
+        if self.count == 0 or other.maximum > self.maximum:
+            self.maximum = other.maximum
+        self.total += other.total
+        self.count += other.count
+        self.sketch.merge(other.sketch)
+
+    def statistics(self):
+        """Returns a tuple of min, average, max, or Nones if the group is empty."""
+        if self.count == 0:
+            return None, None, None
+        return self.minimum, self.total / self.count, self.maximum
+
+    def quantile(self, q: float):
+        """Returns the sketch estimate for quantile q, kept within the exact
+        min and max, or None if the group is empty."""
+        if self.count == 0:
+            return None
+        return min(max(self.sketch.quantile(q), self.minimum), self.maximum)
+
+
+class _PriceIndex(object):
+    """The sorted prices of one group of rows with their prefix sums, so
+    the count, sum, min and max of the prices in any range are found with
+    two binary searches.
+
+    Appended prices are only collected, and sorted into the others by the
+    first read after them, so an append costs O(batch) however large the
+    group is, and a run of appends is merged once.
+    """
+    __slots__ = ("_state",)
+
+    def __init__(self, prices):
+        prices = array('l', sorted(prices))
+        # (sorted prices, prefix sums, appended prices or None), replaced as a
+        # whole so that readers merging the same appended prices at once agree.
+        self._state = (prices, array('q', accumulate(prices, initial=0)), None)
+
+    def add(self, prices):
+        """Collect more prices; the DataSet write lock keeps readers out."""
+        sorted_prices, sums, appended = self._state
+        if appended is None:
+            self._state = (sorted_prices, sums, list(prices))
+        else:
+            appended.extend(prices)
+
+    def _merged(self):
+        """Returns the sorted prices and their prefix sums, merging in the
+        appended prices first if there are any."""
+        prices, sums, appended = self._state
+        if appended is not None:
+            prices = array('l', sorted(prices + array('l', appended)))
+            sums = array('q', accumulate(prices, initial=0))
+            self._state = (prices, sums, None)
+        return prices, sums
+
+    @property
+    def prices(self):
+        return self._merged()[0]
+
+    @property
+    def sums(self):
+        return self._merged()[1]
+
+    def bounds(self, low=None, high=None):
+        """Returns the slice of prices from low to high, both inclusive."""
+        prices = self.prices
+        start = 0 if low is None else bisect_left(prices, low)
+        stop = len(prices) if high is None else bisect_right(prices, high)
+        return start, max(start, stop)
+
+
+class _RangeAggregate(object):
+    """The prices within a range of some _PriceIndex groups, answering the
+    same questions as an _Aggregate. Quantiles are exact here: the value
+    of a rank is found by bisecting on the price across the groups.
+    """
+    __slots__ = ("_slices", "minimum", "total", "count", "maximum")
+
+    def __init__(self, indexes, low=None, high=None):
+        self._slices = []
+        self.minimum = self.maximum = None
+        self.total = self.count = 0
+        for index in indexes:
+            start, stop = index.bounds(low, high)
+            if start == stop:
+                continue
+            prices, sums = index._merged()
+            self._slices.append((prices, start, stop))
+            self.count += stop - start
+            self.total += sums[stop] - sums[start]
+            if self.minimum is None or prices[start] < self.minimum:
+                self.minimum = prices[start]
+            if self.maximum is None or prices[stop - 1] > self.maximum:
+                self.maximum = prices[stop - 1]
+
+    def statistics(self):
+        """Returns a tuple of min, average, max, or Nones if no price is in range."""
+        if self.count == 0:
+            return None, None, None
+        return self.minimum, self.total / self.count, self.maximum
+
+    def quantile(self, q: float):
+        """Returns the price at quantile q, ranked as by _QuantileSketch, or
+        None if no price is in range."""
+        if self.count == 0:
+            return None
+        rank = int(q * (self.count - 1))
+        low, high = self.minimum, self.maximum
+        while low < high:
+            middle = (low + high) // 2
+            if sum(bisect_right(prices, middle, start, stop) - start
+                   for prices, start, stop in self._slices) > rank:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+
+class _ExtremeListings(object):
+    """The k most and k least expensive listings of one group, kept in two
+    bounded heaps as rows stream past, so only 2 * k listings are held.
+    Of listings with equal prices the earliest are kept, so the result does
+    not depend on how the rows were split into batches."""
+    __slots__ = ("k", "_seen", "_top", "_bottom")
+
+    def __init__(self, k: int):
+        self.k = k
+        self._seen = 0
+        # (price, -order, id): the cheapest, then latest, kept listing is on top.
+        self._top = []
+        # (-price, -order, id): the dearest of the kept listings is on top.
+        self._bottom = []
+
+    def add(self, price: int, listing_id: str):
+        self._seen += 1
+        if len(self._top) < self.k:
+            heapq.heappush(self._top, (price, -self._seen, listing_id))
+            heapq.heappush(self._bottom, (-price, -self._seen, listing_id))
+            return
+        if price > self._top[0][0]:
+            heapq.heapreplace(self._top, (price, -self._seen, listing_id))
+        if price < -self._bottom[0][0]:
+            heapq.heapreplace(self._bottom, (-price, -self._seen, listing_id))
+
+    def top(self):
+        """Returns (id, price) pairs from the most expensive down."""
+        return [(listing_id, price) for price, _, listing_id in sorted(self._top, reverse=True)]
+
+    def bottom(self):
+        """Returns (id, price) pairs from the least expensive up."""
+        return [(listing_id, -price)
+                for price, _, listing_id in sorted(self._bottom, reverse=True)]
+
+    def _kept(self):
+        """Returns the kept listings as (order, price, id), oldest first."""
+        kept = {-order: (price, listing_id) for price, order, listing_id in self._top}
+        kept.update((-order, (-price, listing_id)) for price, order, listing_id in self._bottom)
+        return [(order, price, listing_id) for order, (price, listing_id) in sorted(kept.items())]
+
+    def merge(self, other):
+        """Add the listings kept by other, whose rows came after those of
+        self, giving the listings a single pass over both would keep."""
+        for _, price, listing_id in other._kept():
+            self.add(price, listing_id)
+
+    def relabel(self, function):
+        """Returns a copy with function applied to every listing id."""
+        listings = _ExtremeListings(self.k)
+        listings._seen = self._seen
+        listings._top = [(price, order, function(listing_id))
+                         for price, order, listing_id in self._top]
+        listings._bottom = [(price, order, function(listing_id))
+                            for price, order, listing_id in self._bottom]
+        return listings
+
+
+class _ListingHeaps(object):
+    """An _ExtremeListings of the k most and least expensive listings of
+    every (location, property type) pair, fed while rows are loaded."""
+    __slots__ = ("k", "groups")
+
+    def __init__(self, k=DEFAULT_LISTING_COUNT):
+        self.k = k
+        self.groups = {}
+
+    def add(self, keys, prices, ids):
+        """Add the listings with the given group keys, prices and ids, all
+        iterables of the same length."""
+        groups = self.groups
+        for key, price, listing_id in zip(keys, prices, ids):
+            listings = groups.get(key)
+            if listings is None:
+                listings = groups[key] = _ExtremeListings(self.k)
+            listings.add(price, listing_id)
+
+    def add_rows(self, rows, ids=None):
+        """Add (location, property type, price) rows, with their listing ids
+        if given and None ids otherwise."""
+        if rows:
+            locations, property_types, prices = zip(*rows)
+            self.add(zip(locations, property_types), prices,
+                     repeat(None) if ids is None else ids)
+
+    def merge(self, other):
+        """Add the listings of other, whose rows came after those of self."""
+        for key, listings in other.groups.items():
+            mine = self.groups.get(key)
+            if mine is None:
+                mine = self.groups[key] = _ExtremeListings(self.k)
+            mine.merge(listings)
+
+    def relabel(self, key_function, id_function):
+        """Returns a copy with key_function applied to every group key and
+        id_function to every listing id."""
+        heaps = _ListingHeaps(self.k)
+        heaps.groups = {key_function(key): listings.relabel(id_function)
+                        for key, listings in self.groups.items()}
+        return heaps
+
+    def extremes(self, k: int):
+        """Returns a tuple of ((location, property type), top, bottom) in
+        label order, top holding the (id, price) pairs of the k most
+        expensive listings and bottom those of the k least expensive."""
+        return tuple((key, tuple(self.groups[key].top()[:k]),
+                      tuple(self.groups[key].bottom()[:k]))
+                     for key in sorted(self.groups))
+
+    def state(self):
+        """Returns the heaps as a JSON-ready list, see from_state()."""
+        return [[*key, listings._seen, listings._top, listings._bottom]
+                for key, listings in self.groups.items()]
+
+    @classmethod
+    def from_state(cls, k: int, state):
+        heaps = cls(k)
+        for location, property_type, seen, top, bottom in state:
+            listings = heaps.groups[(location, property_type)] = _ExtremeListings(k)
+            listings._seen = seen
+            listings._top = [tuple(item) for item in top]
+            listings._bottom = [tuple(item) for item in bottom]
+        return heaps
+
+
+class _RowInterner(object):
+    """Hands out one shared (location, property type, price) tuple per
+    distinct row, and one shared string per distinct label.
+
+    The rows of a listing file repeat a handful of labels and a few
+    hundred prices, so a list of interned tuples is mostly pointers to a
+    few thousand tuples instead of a tuple, two strings and an int per
+    row. The tuples work with any code indexing or unpacking rows.
+
+    Rows are looked up in rows by a key of the raw fields, before any
+    decoding or int() conversion, which makes a hit cheaper than building
+    the row; on a miss, add() builds and stores it. Past limit distinct
+    rows, new rows are no longer stored, only their labels.
+    """
+    __slots__ = ("rows", "_labels")
+    limit = 1 << 16
+
+    def __init__(self):
+        self.rows = {}
+        self._labels = {}
+
+    def add(self, key, location: str, property_type: str, price: int):
+        labels = self._labels
+        row = (labels.setdefault(location, location),
+               labels.setdefault(property_type, property_type), price)
+        if len(self.rows) < self.limit:
+            self.rows[key] = row
+        return row
+
+
+class _ColumnarRows(object):
+    """Column storage for (location, property type, price) rows.
+
+    Locations and property types are dictionary encoded: each column holds
+    small integer codes into a per-column list of distinct labels, and
+    prices are kept in a flat array('l'). Indexing and iteration still
+    yield (location, property type, price) tuples, so code written against
+    the list-of-tuples layout keeps working.
+    """
+
+    def __init__(self):
+        self.labels = ([], [])
+        self._codes = ({}, {})
+        self._byte_codes = ({}, {})
+        self.locations = array('I')
+        self.property_types = array('I')
+        self.prices = array('l')
+
+    @classmethod
+    def from_columns(cls, labels, locations, property_types, prices):
+        """Build an instance around already encoded columns."""
+        rows = cls()
+        for column, column_labels in enumerate(labels):
+            for label in column_labels:
+                rows._encode(column, label)
+        rows.locations = locations
+        rows.property_types = property_types
+        rows.prices = prices
+        return rows
+
+    def _encode(self, column: int, label: str):
+        code = self._codes[column].get(label)
+        if code is None:
+            code = self._codes[column][label] = len(self.labels[column])
+            self.labels[column].append(label)
+        return code
+
+    def append(self, row):
+        location, property_type, price = row
+        self.locations.append(self._encode(0, location))
+        self.property_types.append(self._encode(1, property_type))
+        self.prices.append(price)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def extend_encoded(self, locations, property_types, prices):
+        """Append columns of raw, undecoded field bytes as produced by
+        DataSet.scan_file. Each distinct label is decoded once; every other
+        occurrence maps straight to the existing code.
+        """
+        self.extend_columns((locations, None), (property_types, None), (prices, None))
+
+    def extend_columns(self, locations, property_types, prices):
+        """Append columns given as (values, codes) pairs of raw field bytes,
+        see _block_columns(): codes is an ndarray of indexes into values, or
+        None when values holds the field of every row. Each distinct value
+        is decoded or converted once.
+        """
+        np = _numpy()
+        for column, target, (values, codes) in ((0, self.locations, locations),
+                                                (1, self.property_types, property_types)):
+            byte_codes = self._byte_codes[column]
+            for value in dict.fromkeys(values):
+                if value not in byte_codes:
+                    byte_codes[value] = self._encode(column, _decode_field(value))
+            if codes is None:
+                target.extend(map(byte_codes.__getitem__, values))
+            else:
+                target.frombytes(np.array([byte_codes[value] for value in values],
+                                          dtype=np.uint32)[codes].tobytes())
+        values, codes = prices
+        if codes is None:
+            self.prices.extend(map(int, values))
+        else:
+            self.prices.frombytes(np.array(list(map(int, values)),
+                                           dtype=np.dtype('l'))[codes].tobytes())
+
+    def add_listings(self, listings, start: int, ids=None):
+        """Feed the rows from start on, keyed by their label codes, to a
+        _ListingHeaps with the given list of ids (None for no ids).
+
+        With NumPy, only the rows among the k most or least expensive of
+        their group in this batch are fed, in their original order; no
+        other row could be kept, so the heaps end up the same.
+        """
+        np = _numpy()
+        if np is None:
+            listings.add(zip(self.locations[start:], self.property_types[start:]),
+                         self.prices[start:], repeat(None) if ids is None else ids)
+            return
+        locations = np.frombuffer(self.locations, dtype=np.uint32)[start:].astype(np.int64)
+        property_types = np.frombuffer(self.property_types, dtype=np.uint32)[start:]
+        groups = locations * len(self.labels[1]) + property_types
+        prices = np.frombuffer(self.prices, dtype=np.dtype('l'))[start:]
+        positions = np.arange(len(groups))
+        chosen = np.zeros(len(groups), dtype=bool)
+        for order in (np.lexsort((positions, prices, groups)),
+                      np.lexsort((positions, -prices, groups))):
+            ordered = groups[order]
+            starts = np.flatnonzero(np.diff(ordered, prepend=-1))
+            ranks = positions - np.repeat(starts, np.diff(np.append(starts, len(ordered))))
+            chosen[order[ranks < listings.k]] = True
+        candidates = np.flatnonzero(chosen).tolist()
+        listings.add(zip(locations[candidates].tolist(), property_types[candidates].tolist()),
+                     prices[candidates].tolist(),
+                     repeat(None) if ids is None else map(ids.__getitem__, candidates))
+
+    def concatenate(self, other):
+        """Append the rows of another _ColumnarRows, translating its codes
+        into this instance's label dictionaries."""
+        for column, codes, other_codes in ((0, self.locations, other.locations),
+                                           (1, self.property_types, other.property_types)):
+            mapping = [self._encode(column, label) for label in other.labels[column]]
+            codes.extend(mapping[code] for code in other_codes)
+        self.prices.extend(other.prices)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def __getitem__(self, idx):
+        return (self.labels[0][self.locations[idx]],
+                self.labels[1][self.property_types[idx]],
+                self.prices[idx])
+
+    def __iter__(self):
+        locations, property_types = self.labels
+        for location, property_type, price in zip(self.locations,
+                                                  self.property_types,
+                                                  self.prices):
+            yield locations[location], property_types[property_type], price
+
+    def to_rows(self):
+        """Returns the rows as a list of tuples, sharing one tuple between
+        equal rows, see _RowInterner."""
+        intern = _RowInterner()
+        shared = intern.rows.get
+        locations, property_types = self.labels
+        return [shared(key) or intern.add(key, locations[key[0]], property_types[key[1]], key[2])
+                for key in zip(self.locations, self.property_types, self.prices)]
+
+    def group_prices(self, start=0):
+        """Returns a dict of (location, property type) -> the sorted prices of
+        the rows from start on, grouped with one sort when NumPy is available."""
+        locations, property_types = self.labels
+        np = _numpy()
+        if np is None:
+            return DataSet._group_prices(zip(map(locations.__getitem__, self.locations[start:]),
+                                             map(property_types.__getitem__,
+                                                 self.property_types[start:]),
+                                             self.prices[start:]))
+        width = len(property_types)
+        groups = np.frombuffer(self.locations, dtype=np.uint32)[start:].astype(np.int64) * \
+            width + np.frombuffer(self.property_types, dtype=np.uint32)[start:]
+        prices = np.frombuffer(self.prices, dtype=np.dtype('l'))[start:]
+        order = np.lexsort((prices, groups))
+        groups, prices = groups[order], prices[order]
+        starts = np.flatnonzero(np.diff(groups, prepend=-1))
+        stops = np.append(starts[1:], len(groups))
+        return {(locations[group // width], property_types[group % width]):
+                prices[begin:end].tolist()
+                for group, begin, end in zip(groups[starts].tolist(), starts.tolist(),
+                                             stops.tolist())}
+
+    def group_aggregates(self, start=0, stop=None):
+        """Returns a dict of (location, property type) -> _Aggregate for the
+        rows in [start, stop), computed as a vectorized group-by when NumPy
+        is available.
+        """
+        locations, property_types = self.labels
+        if stop is None:
+            stop = len(self)
+        np = _numpy()
+        if np is None:
+            index = {}
+            for location, property_type, price in zip(self.locations[start:stop],
+                                                      self.property_types[start:stop],
+                                                      self.prices[start:stop]):
+                aggregate = index.get((location, property_type))
+                if aggregate is None:
+                    aggregate = index[(location, property_type)] = _Aggregate()
+                aggregate.add(price)
+            return {(locations[location], property_types[property_type]): aggregate
+                    for (location, property_type), aggregate in index.items()}
+        width = len(property_types)
+        groups = np.frombuffer(self.locations, dtype=np.uint32)[start:stop].astype(np.int64) * \
+            width + np.frombuffer(self.property_types, dtype=np.uint32)[start:stop]
+        prices = np.frombuffer(self.prices, dtype=np.dtype('l'))[start:stop]
+        size = len(locations) * width
+        counts = np.bincount(groups, minlength=size)
+        totals = np.zeros(size, dtype=np.int64)
+        np.add.at(totals, groups, prices)
+        minimums = np.full(size, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(minimums, groups, prices)
+        maximums = np.full(size, np.iinfo(np.int64).min, dtype=np.int64)
+        np.maximum.at(maximums, groups, prices)
+        index = {}
+        aggregates = {}
+        for group in np.flatnonzero(counts):
+            aggregate = aggregates[group] = _Aggregate()
+            aggregate.minimum = int(minimums[group])
+            aggregate.total = int(totals[group])
+            aggregate.count = int(counts[group])
+            aggregate.maximum = int(maximums[group])
+            index[(locations[group // width], property_types[group % width])] = aggregate
+        distinct, inverse = np.unique(prices, return_inverse=True)
+        pairs, pair_counts = np.unique(groups * len(distinct) + inverse.ravel(),
+                                       return_counts=True)
+        for pair, count in zip(pairs.tolist(), pair_counts.tolist()):
+            group, value = divmod(pair, len(distinct))
+            aggregates[group].sketch.add(int(distinct[value]), count)
+        return index
 
 
 class DataSet(object):
@@ -32,9 +1026,20 @@ class DataSet(object):
     information imported from a .csv file.
     """
     header_length = 30
+    # Currency of the prices in the CSV files.
+    price_currency = "USD"
+    # Number of table results kept by the result cache.
+    result_cache_size = 64
 
-    def __init__(self, header=""):
+    def __init__(self, header="", storage=None):
+        self._lock = _ReadWriteLock()
         self._data = None
+        self.storage = storage or DataSet.Storage.ROWS
+        self._index = {}
+        self._filtered = {
+            DataSet.Categories.LOCATION: {},
+            DataSet.Categories.PROPERTY_TYPE: {}
+        }
         try:
             self.header = header
         except ValueError:
@@ -47,11 +1052,38 @@ class DataSet(object):
             DataSet.Categories.LOCATION: set(),
             DataSet.Categories.PROPERTY_TYPE: set()
         }
+        self._sorted_labels = {
+            DataSet.Categories.LOCATION: [],
+            DataSet.Categories.PROPERTY_TYPE: []
+        }
+        # Bumped by every change to the data, see _data_changed().
+        self._version = 0
+        self._results = OrderedDict()
+        self._results_lock = threading.Lock()
+        self._result_hits = 0
+        self._result_misses = 0
+        # An Instrumentation while enable_instrumentation() is in effect.
+        self.instrumentation = None
+        # Set for the threads running _try_read().
+        self._probing = threading.local()
+        # (low, high) prices shown by the tables, either bound may be None.
+        self._price_range = None
+        # {(location, property type): _PriceIndex}, built as the data is loaded.
+        self._price_index = {}
+        # The k most and least expensive listings of each label pair.
+        self._listings = _ListingHeaps()
+        # See _listing_source(), for every file in the data, or None once
+        # rows were added from elsewhere.
+        self._listing_sources = []
 
     class EmptyDatasetError(Exception):
         """Custom Error class that raises the Empty data set error in case of one."""
         pass
 
+    class _CacheMiss(Exception):
+        """Raised by _cached() instead of computing a result within _try_read()."""
+        pass
+
     class Categories(Enum):
         LOCATION = 0
         PROPERTY_TYPE = 1
@@ -60,6 +1092,18 @@ class DataSet(object):
         MIN = 0
         AVG = 1
         MAX = 2
+        # Estimated from quantile sketches, within 1% of the true value.
+        MEDIAN = 3
+        P90 = 4
+        P99 = 5
+
+    class Storage(Enum):
+        ROWS = 0
+        COLUMNAR = 1
+
+    class ExportFormat(Enum):
+        CSV = 0
+        JSON = 1
 
     @property
     def header(self):
@@ -77,6 +1121,7 @@ class DataSet(object):
             # print('This Header "{}" is too long, not valid.\n Header must be a string less than 30 '
             #       'characters long.'.format(new_header))
 
+    @_reads
     def _cross_table_statistics(self, descriptor_one: str, descriptor_two: str):
         """ Given a label from each category, calculate summary
         statistics for the items matching both labels.
@@ -88,79 +1133,860 @@ class DataSet(object):
         Returns a tuple of min, average, max from the matching rows."""
         if not self._data:
             raise DataSet.EmptyDatasetError
-        value_list = [item[2] for item in self._data if
-                      item[0] == descriptor_one and item[1] == descriptor_two]
-        if len(value_list) == 0:
+        aggregate = self._cell_aggregate(descriptor_one, descriptor_two)
+        if aggregate is None:
             return None, None, None
-        return min(value_list), sum(value_list) / len(value_list), max(value_list)
+        return aggregate.statistics()
 
     def load_default_data(self):
-        self._data = self.load_file()
+        self.load_data(DEFAULT_DATA_FILE, cache=True)
+
+    @_instrumented("load_data", _loaded_rows)
+    @_writes
+    def load_data(self, source=DEFAULT_DATA_FILE, columns=DEFAULT_COLUMNS,
+                  chunk_size=DEFAULT_CHUNK_SIZE, progress=None, cache=False,
+                  id_column=DEFAULT_ID_COLUMN):
+        """Load rows from source chunk by chunk, folding each chunk into the
+        aggregation index as it arrives, then initialize the label sets.
+
+        Keyword arguments:
+            source -- a path or an open file object, plain, gzip or bz2 compressed
+            columns -- positions or header names of the location, property type
+                       and price fields
+            chunk_size -- the number of rows parsed before they are aggregated,
+                          for file objects and compressed files; uncompressed
+                          files are scanned in blocks of DEFAULT_BLOCK_SIZE
+                          bytes instead, see scan_file()
+            progress -- optional callable, given the row count after each chunk
+                        or block
+            cache -- for paths, reuse the binary cache written next to the file
+                     while the file is unchanged, and (re)write it otherwise
+            id_column -- position or header name of the listing ids kept for
+                         extreme_listings(), or None to keep no ids
+        """
+        columnar = self.storage is DataSet.Storage.COLUMNAR
+        if isinstance(source, (str, os.PathLike)):
+            with self._operation("read_cache"):
+                cached = _read_cache(source, columns, id_column) if cache else None
+            if cached is not None:
+                rows, listings = cached
+                with self._operation("aggregate") as measurement:
+                    index = rows.group_aggregates()
+                    measurement.rows = len(rows)
+                if progress is not None:
+                    progress(len(rows))
+            else:
+                with self._operation("parse") as measurement:
+                    if self._opener(source) is open:
+                        listings = _ListingHeaps()
+                        rows = self.scan_file(source, columns, progress=progress,
+                                              listings=listings, id_column=id_column)
+                        index = None
+                    else:
+                        rows, index, listings = self._parse_source(
+                            source, columns, chunk_size, True, progress, id_column)
+                    measurement.rows = len(rows)
+                if index is None:
+                    with self._operation("aggregate") as measurement:
+                        index = rows.group_aggregates()
+                        measurement.rows = len(rows)
+                if cache:
+                    with self._operation("write_cache"):
+                        _write_cache(source, columns, rows, listings, id_column)
+            self._data = rows if columnar else rows.to_rows()
+            self._index = index
+            self._listing_sources = [self._listing_source(source, columns, id_column)]
+        else:
+            self._data, self._index, listings = self._parse_source(
+                source, columns, chunk_size, columnar, progress, id_column)
+            self._listing_sources = None
+        self._listings = listings
         self._initialize_sets()
+        self._build_price_index()
+        self._data_changed()
+
+    @_instrumented("load_files", _loaded_rows)
+    @_writes
+    def load_files(self, paths, columns=DEFAULT_COLUMNS, chunk_size=DEFAULT_CHUNK_SIZE,
+                   workers=None, id_column=DEFAULT_ID_COLUMN):
+        """Load several CSV shards sharing one schema as a single data set.
+
+        Each shard is parsed in its own worker process into its rows, a
+        partial aggregation index and its listing heaps. The parent appends
+        the rows in the order of paths and merges the partial indexes and
+        heaps, which is associative, so the result is the same as loading
+        the concatenated files.
+
+        Keyword arguments:
+            paths -- the shard paths, plain, gzip or bz2 compressed
+            columns -- positions or header names of the location, property type
+                       and price fields
+            chunk_size -- the number of rows parsed before they are aggregated
+            workers -- the number of processes; defaults to os.cpu_count(), and
+                       1 parses the shards in this process
+            id_column -- position or header name of the listing ids, or None
+        """
+        paths = list(paths)
+        columnar = self.storage is DataSet.Storage.COLUMNAR
+        jobs = [(path, columns, chunk_size, columnar, id_column) for path in paths]
+        workers = min(workers or os.cpu_count() or 1, len(paths) or 1)
+        if workers == 1:
+            shards = [_load_shard(job) for job in jobs]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                shards = list(executor.map(_load_shard, jobs))
+        data = _ColumnarRows() if columnar else []
+        index = {}
+        listings = _ListingHeaps()
+        for rows, partial, shard_listings in shards:
+            if columnar:
+                data.concatenate(rows)
+            else:
+                data.extend(rows)
+            self._merge_index(index, partial)
+            listings.merge(shard_listings)
+        self._data = data
+        self._index = index
+        self._listings = listings
+        self._listing_sources = [self._listing_source(path, columns, id_column)
+                                 for path in paths]
+        self._initialize_sets()
+        self._build_price_index()
+        self._data_changed()
+
+    @_instrumented("append_rows", _returned_rows)
+    @_writes
+    def append_rows(self, rows, ids=None):
+        """Add (location, property type, price) rows to the loaded data.
+
+        Only the new rows are aggregated: their partial index is merged into
+        the existing one, and the filtered label totals are updated cell by
+        cell. Labels seen for the first time are added as active, while the
+        active state of existing labels is left as it is, so the tables equal
+        those of a full reload of all the rows under the same filters.
+        ids, if given, holds the listing id of each row for extreme_listings(),
+        which otherwise shows the rows without one.
+        Returns the number of rows added.
+        """
+        rows = list(rows)
+        if ids is not None:
+            ids = list(ids)
+            if len(ids) != len(rows):
+                raise ValueError("Expected one listing id per row")
+        if not rows:
+            return 0
+        self._data_changed()
+        self._listing_sources = None
+        self._listings.add_rows(rows, ids)
+        if not self._data:
+            columnar = self.storage is DataSet.Storage.COLUMNAR
+            self._data = _ColumnarRows() if columnar else []
+            self._data.extend(rows)
+            self._build_index()
+            self._initialize_sets()
+            self._build_price_index()
+            return len(rows)
+        start = len(self._data)
+        self._data.extend(rows)
+        if isinstance(self._data, _ColumnarRows):
+            partial = self._data.group_aggregates(start)
+            prices = self._data.group_prices(start)
+        else:
+            partial = {}
+            self._aggregate_rows(partial, rows)
+            prices = self._group_prices(rows)
+        for key, group_prices in prices.items():
+            if key in self._price_index:
+                self._price_index[key].add(group_prices)
+            else:
+                self._price_index[key] = _PriceIndex(group_prices)
+        new_labels = {category: {key[category.value] for key in partial} - self._labels[category]
+                      for category in self.Categories}
+        self._merge_index(self._index, partial)
+        for category, labels in new_labels.items():
+            for label in labels:
+                self._labels[category].add(label)
+                self._active_labels[category].add(label)
+                insort(self._sorted_labels[category], label)
+        location_category, property_category = self.Categories
+        for (location, property_type), aggregate in partial.items():
+            if location not in new_labels[location_category] and \
+                    property_type in self._active_labels[property_category]:
+                self._filtered[location_category][location].merge(aggregate)
+            if property_type not in new_labels[property_category] and \
+                    location in self._active_labels[location_category]:
+                self._filtered[property_category][property_type].merge(aggregate)
+        for category, labels in new_labels.items():
+            for label in labels:
+                self._filtered[category][label] = self._filtered_aggregate(category, label)
+        return len(rows)
+
+    @_instrumented("ingest", _returned_rows)
+    def ingest(self, source, columns=DEFAULT_COLUMNS, chunk_size=DEFAULT_CHUNK_SIZE,
+               id_column=DEFAULT_ID_COLUMN):
+        """Append every row of a CSV stream or path, one chunk at a time,
+        with append_rows(), along with the listing ids in id_column. Only
+        each chunk is applied under the write lock, so readers carry on
+        between the chunks of a slow stream. Returns the number of rows added."""
+        with self._lock.reading():
+            sources, version = self._listing_sources, self._version
+        added = chunks = 0
+        for chunk, ids in self._iter_listing_chunks(source, columns, chunk_size, id_column):
+            added += self.append_rows(chunk, ids)
+            chunks += 1
+        if added and sources is not None and isinstance(source, (str, os.PathLike)):
+            with self._lock.writing():
+                # Each chunk made one new version: if no other change came in
+                # between, the data is that of the files before plus source.
+                if self._version == version + chunks:
+                    self._listing_sources = sources + [
+                        self._listing_source(source, columns, id_column)]
+        return added
+
+    @staticmethod
+    def _parse_source(source, columns, chunk_size, columnar, progress=None,
+                      id_column=DEFAULT_ID_COLUMN):
+        """Parse source into its rows, aggregation index and _ListingHeaps,
+        chunk by chunk."""
+        data = _ColumnarRows() if columnar else []
+        index = {}
+        listings = _ListingHeaps()
+        for chunk, ids in DataSet._iter_listing_chunks(source, columns, chunk_size, id_column):
+            start = len(data)
+            data.extend(chunk)
+            if columnar:
+                DataSet._merge_index(index, data.group_aggregates(start))
+            else:
+                DataSet._aggregate_rows(index, chunk)
+            listings.add_rows(chunk, ids)
+            if progress is not None:
+                progress(len(data))
+        return data, index, listings
+
+    def _build_index(self):
+        """Aggregate self._data into one _Aggregate per (location, property type)
+        pair in a single pass, so each cross table cell is an O(1) lookup.
+        """
+        if isinstance(self._data, _ColumnarRows):
+            self._index = self._data.group_aggregates()
+            return
+        index = {}
+        self._aggregate_rows(index, self._data)
+        self._index = index
+
+    def _build_price_index(self):
+        """Build the _PriceIndex of every (location, property type) pair of
+        self._data, for the price range filter."""
+        if isinstance(self._data, _ColumnarRows):
+            groups = self._data.group_prices()
+        else:
+            groups = self._group_prices(self._data)
+        self._price_index = {key: _PriceIndex(prices) for key, prices in groups.items()}
+
+    @staticmethod
+    def _group_prices(rows):
+        """Returns a dict of (location, property type) -> the prices of rows."""
+        groups = {}
+        for location, property_type, price in rows:
+            prices = groups.get((location, property_type))
+            if prices is None:
+                prices = groups[(location, property_type)] = []
+            prices.append(price)
+        return groups
+
+    @staticmethod
+    def _aggregate_rows(index: dict, rows):
+        """Fold (location, property type, price) rows into index."""
+        for location, property_type, price in rows:
+            aggregate = index.get((location, property_type))
+            if aggregate is None:
+                aggregate = index[(location, property_type)] = _Aggregate()
+            aggregate.add(price)
+
+    @staticmethod
+    def _merge_index(index: dict, partial: dict):
+        """Merge the aggregates of partial into index."""
+        for key, aggregate in partial.items():
+            if key in index:
+                index[key].merge(aggregate)
+            else:
+                index[key] = aggregate
 
     @staticmethod
     def load_file():
         """Load all the data from AB_NYC_2019.csv file into self._data"""
-        with open('AB_NYC_2019.csv', 'r') as csv_file:
+        return [row for chunk in DataSet.iter_chunks(DEFAULT_DATA_FILE) for row in chunk]
+
+    @staticmethod
+    def iter_chunks(source=DEFAULT_DATA_FILE, columns=DEFAULT_COLUMNS,
+                    chunk_size=DEFAULT_CHUNK_SIZE, id_column=None):
+        """Yield lists of at most chunk_size (location, property type, price)
+        tuples read from source, so only one chunk is held at a time. Equal
+        rows share one tuple, see _RowInterner.
+
+        Keyword arguments:
+            source -- a path or an open file object, plain, gzip or bz2 compressed
+            columns -- positions or header names of the location, property type
+                       and price fields
+            chunk_size -- the maximum number of rows in each chunk
+            id_column -- position or header name of the listing id; if given,
+                         (chunk, ids) pairs are yielded instead, ids holding
+                         the listing id of each row
+        """
+        chunks = DataSet._iter_listing_chunks(source, columns, chunk_size, id_column)
+        if id_column is not None:
+            return chunks
+        return (chunk for chunk, _ in chunks)
+
+    @staticmethod
+    def _iter_listing_chunks(source, columns, chunk_size, id_column):
+        """Yield the (chunk, ids) pairs of iter_chunks(), with None for ids
+        when id_column is None."""
+        with DataSet._open_text(source) as csv_file:
             csv_reader = csv.reader(csv_file)
-            return_list = []
-            next(csv_reader)
+            header = next(csv_reader, None)
+            if header is None:
+                return
+            location, property_type, price = \
+                [header.index(column) if isinstance(column, str) else column
+                 for column in columns]
+            listing = header.index(id_column) if isinstance(id_column, str) else id_column
+            intern = _RowInterner()
+            shared = intern.rows.get
+            chunk = []
+            ids = None if listing is None else []
             for line in csv_reader:
-                item = line[1], line[2], int(line[3])
-                return_list.append(item)
-            return return_list
+                key = (line[location], line[property_type], line[price])
+                chunk.append(shared(key) or intern.add(key, key[0], key[1], int(key[2])))
+                if ids is not None:
+                    ids.append(line[listing])
+                if len(chunk) >= chunk_size:
+                    yield chunk, ids
+                    chunk = []
+                    ids = None if listing is None else []
+            if chunk:
+                yield chunk, ids
 
     @staticmethod
-    def bubble_sort(list_to_sort: list):
-        """By use of bubble sort and recursion, the static function
-        orders the labels alphabetically in ascending order."""
-        count = 0
-        array = list_to_sort[:]
-        for idx in range(len(array) - 1):
-            if array[idx] > array[idx + 1]:
-                array[idx], array[idx + 1] = array[idx + 1], array[idx]
-                count += 1
-        if count == 0:
-            return array
+    def scan_file(path, columns=DEFAULT_COLUMNS, block_size=DEFAULT_BLOCK_SIZE,
+                  progress=None, listings=None, id_column=DEFAULT_ID_COLUMN):
+        """Scan an uncompressed CSV file through mmap and return its rows as
+        _ColumnarRows, without decoding the fields that are not needed.
+
+        The file is split in blocks of about block_size bytes ending on a line
+        break. A block without quotes in which every line holds the header's
+        number of fields is read a column at a time by _block_columns(), with
+        NumPy locating every field at once so that only distinct values are
+        sliced out and decoded. From the first block that does not qualify,
+        the rest of the file is matched row by row with a regular expression
+        over the mapped bytes, which handles quoted fields holding commas,
+        quotes and line breaks, and raises ValueError for rows of the wrong
+        width.
+
+        Keyword arguments:
+            path -- the path of the file
+            columns -- positions or header names of the location, property type
+                       and price fields
+            block_size -- the approximate number of bytes split at once
+            progress -- optional callable, given the row count after each block
+            listings -- optional _ListingHeaps, fed the listing id in id_column
+                        (None for no ids) of every row
+        """
+        rows = _ColumnarRows()
+        with open(path, 'rb') as csv_file:
+            if os.fstat(csv_file.fileno()).st_size == 0:
+                return rows
+            with mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                header_end = buffer.find(b'\n')
+                if header_end == -1:
+                    return rows
+                header = next(csv.reader([buffer[:header_end].rstrip(b'\r').decode('utf-8')]))
+                positions = [header.index(column) if isinstance(column, str) else column
+                             for column in columns]
+                if listings is not None and id_column is not None:
+                    positions.append(header.index(id_column) if isinstance(id_column, str)
+                                     else id_column)
+                # Fed with label codes and raw ids, translated once at the end.
+                heaps = None if listings is None else _ListingHeaps(listings.k)
+                width = len(header)
+                position = header_end + 1
+                while position < len(buffer):
+                    end = buffer.find(b'\n', position + block_size)
+                    end = len(buffer) if end == -1 else end + 1
+                    block = buffer[position:end].rstrip(b'\r\n')
+                    if not block or b'"' in block:
+                        break
+                    columns = _block_columns(block, width, positions)
+                    if columns is None:
+                        break
+                    start = len(rows)
+                    rows.extend_columns(*columns[:3])
+                    if heaps is not None:
+                        ids = None
+                        if len(columns) > 3:
+                            ids, codes = columns[3]
+                            if codes is not None:
+                                ids = list(map(ids.__getitem__, codes.tolist()))
+                        rows.add_listings(heaps, start, ids)
+                    position = end
+                    if progress is not None:
+                        progress(len(rows))
+                if position < len(buffer):
+                    start = len(rows)
+                    ids = DataSet._scan_rows(buffer, position, width, positions, rows)
+                    if heaps is not None:
+                        rows.add_listings(heaps, start, ids)
+                    if progress is not None:
+                        progress(len(rows))
+        if heaps is not None:
+            locations, property_types = rows.labels
+            listings.merge(heaps.relabel(
+                lambda key: (locations[key[0]], property_types[key[1]]),
+                lambda listing_id: None if listing_id is None else _decode_field(listing_id)))
+        return rows
+
+    @staticmethod
+    def _scan_rows(buffer, position: int, width: int, positions, rows: _ColumnarRows):
+        """Match the rows of buffer from position onwards one at a time,
+        appending the wanted fields to rows. Blank lines are skipped, and a
+        row that does not have width fields raises ValueError. A fourth
+        position is that of the listing id, whose raw fields are returned;
+        otherwise None is.
+        """
+        row_pattern = re.compile(rb'(?:\r?\n)*' + rb','.join([_FIELD_PATTERN] * width) +
+                                 rb'(?:\r?\n|\Z)')
+        trailing = re.compile(rb'(?:\r?\n)*\Z')
+        columns = tuple([] for _ in positions)
+        while not trailing.match(buffer, position):
+            match = row_pattern.match(buffer, position)
+            if match is None:
+                raise ValueError(f"Malformed CSV row at byte {position}")
+            fields = match.groups()
+            for column, field in zip(columns, positions):
+                column.append(fields[field])
+            position = match.end()
+        prices = [price[1:-1].replace(b'""', b'"') if price[:1] == b'"' else price
+                  for price in columns[2]]
+        rows.extend_encoded(columns[0], columns[1], prices)
+        return columns[3] if len(columns) > 3 else None
+
+    @staticmethod
+    def _opener(path):
+        """Returns gzip.open, bz2.open or open, by the file's leading magic bytes."""
+        with open(path, 'rb') as probe:
+            magic = probe.read(3)
+        if magic[:2] == b'\x1f\x8b':
+            return gzip.open
+        if magic == b'BZh':
+            return bz2.open
+        return open
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _open_text(source):
+        """Context manager giving a text stream over source.
+
+        Paths are opened here and closed on exit; gzip and bz2 files are
+        recognised by their leading magic bytes. Open file objects are left
+        open for the caller, and binary ones are decompressed and decoded.
+        """
+        if isinstance(source, (str, bytes, os.PathLike)):
+            with DataSet._opener(source)(source, 'rt', newline='') as text:
+                yield text
+            return
+        if isinstance(source.read(0), str):
+            yield source
+            return
+        if hasattr(source, 'peek'):
+            magic = source.peek(3)[:3]
         else:
-            return DataSet.bubble_sort(array)
+            magic = source.read(3)
+            source.seek(-len(magic), io.SEEK_CUR)
+        if magic[:2] == b'\x1f\x8b':
+            source = gzip.GzipFile(fileobj=source)
+        elif magic == b'BZh':
+            source = bz2.BZ2File(source)
+        text = io.TextIOWrapper(source, newline='')
+        try:
+            yield text
+        finally:
+            text.detach()
 
+    @staticmethod
+    def bubble_sort(list_to_sort: list):
+        """Returns a new list of the labels in ascending alphabetical order.
+        Kept under its original name for existing callers; it now uses
+        sorted() instead of a recursive bubble sort, with the same result."""
+        return sorted(list_to_sort)
+
+    @_instrumented("initialize_sets")
     def _initialize_sets(self):
         """Examine the category labels in self._data and create a set for each category
-        containing the labels.
+        containing the labels. The labels are read from the aggregation index
+        keys, which hold every (location, property type) pair in the data.
         """
 
         if not self._data:
             raise DataSet.EmptyDatasetError
         for category in self.Categories:
-            self._labels[category] = set([i[category.value] for i in self._data])
+            self._labels[category] = set([key[category.value] for key in self._index])
             self._active_labels[category] = self._labels[category].copy()
+            self._sorted_labels[category] = sorted(self._labels[category])
+        self._build_filtered_totals()
 
-    def display_cross_table(self, stat: Stats):
-        """ prints the table of statistics. Depends on whether the values are Min, Avg or Max.
-        Use _cross_table_statistics() method to calculate values that appear in the table.
+    def enable_instrumentation(self, memory=False, profile=False):
+        """Start measuring the operations of this DataSet, see Instrumentation.
+        memory also records the tracemalloc peak of each operation and
+        profile runs them under cProfile. Returns the Instrumentation."""
+        self.disable_instrumentation()
+        self.instrumentation = Instrumentation(memory, profile)
+        return self.instrumentation
+
+    def disable_instrumentation(self):
+        """Stop measuring and return the Instrumentation, if any, whose
+        stats remain readable."""
+        instrumentation, self.instrumentation = self.instrumentation, None
+        if instrumentation is not None:
+            instrumentation.close()
+        return instrumentation
+
+    def _operation(self, name: str):
+        """Returns a context manager measuring its body as operation name,
+        which does nothing without instrumentation."""
+        if self.instrumentation is None:
+            return contextlib.nullcontext(_Measurement())
+        return self.instrumentation.operation(name, self)
+
+    def _data_changed(self):
+        """Start a new data version, which drops every cached table result.
+        Must be called by each method that changes _data or _index."""
+        with self._results_lock:
+            self._version += 1
+            self._results.clear()
+
+    def _filter_state(self):
+        """Returns the active labels of every category and the price range
+        as a hashable value."""
+        return tuple(frozenset(self._active_labels[category])
+                     for category in self.Categories) + (self._price_range,)
+
+    def _cached(self, key: tuple, compute):
+        """Returns the result cached for key under the current data version,
+        calling compute() to fill the cache on a miss. The least recently
+        used result is dropped once result_cache_size are held. Cached
+        results are shared between callers, so compute() must return an
+        immutable value.
         """
+        key = (self._version,) + key
+        with self._results_lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self._result_hits += 1
+                return self._results[key]
+            if getattr(self._probing, "active", False):
+                raise DataSet._CacheMiss
+            self._result_misses += 1
+        result = compute()
+        with self._results_lock:
+            if key[0] == self._version:
+                self._results[key] = result
+                if len(self._results) > self.result_cache_size:
+                    self._results.popitem(last=False)
+        return result
+
+    def _try_read(self, function, *args, **kwargs):
+        """Returns (True, function(*args, **kwargs)) if the read lock is free
+        and every table function needs is in the result cache, and
+        (False, None) without waiting or computing anything otherwise."""
+        if not self._lock.acquire_read(blocking=False):
+            return False, None
+        self._probing.active = True
         try:
+            return True, function(*args, **kwargs)
+        except DataSet._CacheMiss:
+            return False, None
+        finally:
+            self._probing.active = False
+            self._lock.release_read()
+
+    def cache_info(self):
+        """Returns a dict of the result cache's hits, misses, current size
+        and maximum size."""
+        with self._results_lock:
+            return {"hits": self._result_hits, "misses": self._result_misses,
+                    "size": len(self._results), "maxsize": self.result_cache_size}
+
+    def _cell(self, row_category, descriptor: str, detail_label: str):
+        """Returns the index aggregate for a row label and a label of the
+        alternate category, or None if no rows match both."""
+        if row_category is self.Categories.LOCATION:
+            return self._index.get((descriptor, detail_label))
+        return self._index.get((detail_label, descriptor))
+
+    def _cell_aggregate(self, location: str, property_type: str):
+        """Returns the index aggregate of a cross table cell or, with a price
+        range set, its prices within the range. None if no rows match both
+        labels."""
+        if self._price_range is None:
+            return self._index.get((location, property_type))
+        index = self._price_index.get((location, property_type))
+        return None if index is None else _RangeAggregate([index], *self._price_range)
+
+    def _range_aggregate(self, row_category, descriptor: str):
+        """Returns the prices within the price range of the rows matching
+        descriptor and an active label of the alternate category."""
+        detail_category = self._alternate_category_type(row_category)
+        indexes = self._price_index
+        keys = [(descriptor, label) if row_category is self.Categories.LOCATION
+                else (label, descriptor) for label in self._active_labels[detail_category]]
+        return _RangeAggregate([indexes[key] for key in keys if key in indexes],
+                               *self._price_range)
+
+    @staticmethod
+    def _listing_source(path, columns, id_column):
+        """Returns what scan_listings() needs to read path again: its
+        absolute path, columns, id_column, size and mtime."""
+        stat = os.stat(path)
+        return os.path.abspath(path), tuple(columns), id_column, stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def scan_listings(sources, k: int, price_range=None):
+        """Stream the files of sources, as given by _listing_source(), once,
+        keeping the k most and least expensive listings of each (location,
+        property type) pair within price_range, a (low, high) pair whose
+        bounds may be None. Returns a _ListingHeaps. Raises ValueError if a
+        file changed since its source was recorded.
+        """
+        low, high = price_range or (None, None)
+        listings = _ListingHeaps(k)
+        for path, columns, id_column, size, mtime_ns in sources:
+            stat = os.stat(path)
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                raise ValueError(f"{path} changed since it was loaded")
+            for chunk, ids in DataSet._iter_listing_chunks(path, columns, DEFAULT_CHUNK_SIZE,
+                                                           id_column):
+                rows = [(row, listing_id) for row, listing_id
+                        in zip(chunk, repeat(None) if ids is None else ids)
+                        if (low is None or row[2] >= low) and (high is None or row[2] <= high)]
+                listings.add_rows([row for row, _ in rows], [listing_id for _, listing_id in rows])
+        return listings
+
+    @_instrumented("extreme_listings")
+    def extreme_listings(self, k=5, currency=None):
+        """Returns a list of ((location, property type), top, bottom) for
+        each pair whose labels are both active, in label order. top holds
+        the (listing id, price) pairs of the k most expensive listings in
+        the price range, bottom those of the k least expensive ones. The id
+        of a row added without one is None.
+
+        The DEFAULT_LISTING_COUNT most and least expensive listings of each
+        pair are kept in bounded heaps as rows are loaded or appended, so k
+        may not be larger. Those cannot tell which listings are within a
+        price range, so with one set, the files the data came from are read
+        again instead, outside the lock, once per k and price range. That
+        raises ValueError if rows were added other than from files or if a
+        file changed since it was loaded, and for a k below 1.
+        """
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        with self._lock.reading():
             if not self._data:
                 raise DataSet.EmptyDatasetError
-            property_labels = DataSet.bubble_sort(list(self._labels[DataSet.Categories.PROPERTY_TYPE]))
-            location_labels = DataSet.bubble_sort(list(self._labels[DataSet.Categories.LOCATION]))
-            print(f"                ", end="")
-            for item in property_labels:
-                print(f"{item:20}", end="")
-            print()
-            for item_one in location_labels:
-                print(f" {item_one:15}", end="")
-                for item_two in property_labels:
-                    value = self._cross_table_statistics(item_one,
-                                                         item_two)[stat.value]
-                    if value is None:
-                        print(f"$ {'N/A':<18}", end="")
-                    else:
-                        print(f"$ {value:<18.2f}", end="")
-                print()
+            active = [set(self._active_labels[category]) for category in self.Categories]
+            price_range, sources = self._price_range, self._listing_sources
+            if price_range is None:
+                if k > self._listings.k:
+                    raise ValueError(f"At most {self._listings.k} listings are kept per group")
+                groups = self._listings.extremes(k)
+        if price_range is not None:
+            if sources is None:
+                raise ValueError("Listings in a price range are only known for data "
+                                 "loaded from files")
+            groups = self._cached(("listing_scan", k, price_range, tuple(sources)),
+                                  lambda: self.scan_listings(sources, k, price_range).extremes(k))
+        rate = _conversion_rate(self.price_currency, currency or self.price_currency)
+        return [(key, [(listing_id, price * rate) for listing_id, price in top],
+                 [(listing_id, price * rate) for listing_id, price in bottom])
+                for key, top, bottom in groups
+                if key[0] in active[0] and key[1] in active[1]]
+
+    def display_extreme_listings(self, k=5, out=None, currency=None):
+        """ Prints the ids and prices of the k most and least expensive
+        listings of every active location and property type pair, built in
+        memory and written to out (stdout by default) at once.
+        """
+        out = out or sys.stdout
+        try:
+            groups = self.extreme_listings(k, currency)
         except DataSet.EmptyDatasetError:
-            print("Please Add a data set first!")
+            print("Please Add a data set first!", file=out)
+            return
+        lines = []
+        for (location, property_type), top, bottom in groups:
+            lines.append(f"{location} - {property_type}")
+            lines.append(f"{'':6}{'Most Expensive':34}Least Expensive")
+            for rank in range(max(len(top), len(bottom))):
+                cells = [f"{'N/A' if listing_id is None else listing_id:12}" +
+                         _money_cell(price, currency)
+                         for listing_id, price in (top[rank], bottom[rank])]
+                lines.append(f"{rank + 1:>4}  " + "  ".join(cells))
+        out.write("\n".join(lines) + "\n")
+
+    @_reads
+    def price_range_statistics(self, low=None, high=None, location=None, property_type=None):
+        """Returns the count, min, average and max of the prices from low to
+        high, both inclusive, of the rows matching location and property_type,
+        where None matches every label. Each matching (location, property
+        type) pair costs two binary searches; the label filters are not used.
+        """
+        _check_price_bounds(low, high)
+        if not self._data:
+            raise DataSet.EmptyDatasetError
+        aggregate = _RangeAggregate(
+            [index for (row_location, row_property_type), index in self._price_index.items()
+             if location in (None, row_location) and property_type in (None, row_property_type)],
+            low, high)
+        return (aggregate.count,) + aggregate.statistics()
+
+    @_writes
+    def set_price_range(self, low=None, high=None):
+        """Limit the tables to prices from low to high, both inclusive.
+        Either bound may be None, and with both None the filter is removed.
+        Raises ValueError for a bound that is not a number."""
+        _check_price_bounds(low, high)
+        if low is not None and high is not None and low > high:
+            raise ValueError("The low price must not exceed the high price")
+        self._price_range = None if low is None and high is None else (low, high)
+
+    @_reads
+    def get_price_range(self):
+        """Returns the (low, high) price range filter, or None."""
+        return self._price_range
+
+    def _build_filtered_totals(self):
+        """For every label, combine the index cells whose alternate category
+        label is active. _table_statistics reads these totals directly and
+        toggle_active_labels keeps them up to date.
+        """
+        for category in self.Categories:
+            self._filtered[category] = {descriptor: self._filtered_aggregate(category, descriptor)
+                                        for descriptor in self._labels[category]}
+
+    def _filtered_aggregate(self, row_category, descriptor: str):
+        """Combine the cells for descriptor across the active alternate labels."""
+        detail_category = self._alternate_category_type(row_category)
+        aggregate = _Aggregate()
+        for detail_label in self._active_labels[detail_category]:
+            cell = self._cell(row_category, descriptor, detail_label)
+            if cell is not None:
+                aggregate.merge(cell)
+        return aggregate
+
+    def _update_filtered_totals(self, category, detail_label: str, added: bool):
+        """Apply the activation or removal of detail_label to the filtered
+        totals of every label in the alternate category. Sums and counts are
+        adjusted in place; min/max only need recomputing from the remaining
+        active cells when the removed cell held the current extreme.
+        """
+        row_category = self._alternate_category_type(category)
+        for descriptor, aggregate in self._filtered[row_category].items():
+            cell = self._cell(row_category, descriptor, detail_label)
+            if cell is None:
+                continue
+            if added:
+                aggregate.merge(cell)
+            elif aggregate.count == cell.count or cell.minimum == aggregate.minimum or \
+                    cell.maximum == aggregate.maximum:
+                self._filtered[row_category][descriptor] = \
+                    self._filtered_aggregate(row_category, descriptor)
+            else:
+                aggregate.total -= cell.total
+                aggregate.count -= cell.count
+                aggregate.sketch.subtract(cell.sketch)
+
+    @_instrumented("cross_table")
+    @_reads
+    def cross_table(self, stat: Stats, currency=None):
+        """ Returns the cross table for stat as a tuple of the sorted
+        property type labels and a tuple of (location, values) rows, where
+        values holds one statistic (or None) per property type, converted
+        into currency if one is given. The result is built of tuples, since
+        the result cache hands the same one to every caller.
+        """
+        if not self._data:
+            raise DataSet.EmptyDatasetError
+        # The cross table covers every label, so only the price range filters it.
+        return self._cached(("cross_table", stat, currency, self._price_range),
+                            lambda: self._compute_cross_table(stat, currency))
+
+    @_instrumented("aggregate_cross_table")
+    def _compute_cross_table(self, stat: Stats, currency=None):
+        rate = _conversion_rate(self.price_currency, currency or self.price_currency)
+        property_labels = tuple(self._sorted_labels[DataSet.Categories.PROPERTY_TYPE])
+        location_labels = self._sorted_labels[DataSet.Categories.LOCATION]
+        rows = tuple((location, _scale_values(
+                         [self._cross_statistic(location, property_type, stat)
+                          for property_type in property_labels], rate))
+                     for location in location_labels)
+        return property_labels, rows
+
+    def _cross_statistic(self, location: str, property_type: str, stat: Stats):
+        """ Returns one statistic for a cross table cell, from
+        _cross_table_statistics() or, for quantiles, the cell's sketch.
+        """
+        if stat in _QUANTILES:
+            aggregate = self._cell_aggregate(location, property_type)
+            return None if aggregate is None else aggregate.quantile(_QUANTILES[stat])
+        return self._cross_table_statistics(location, property_type)[stat.value]
+
+    @_instrumented("display_cross_table")
+    @_reads
+    def display_cross_table(self, stat: Stats, out=None, currency=None):
+        """ prints the table of statistics. Depends on whether the values are Min, Avg or Max.
+        Use _cross_table_statistics() method to calculate values that appear in the table.
+        The table is built in memory and written to out (stdout by default) at once.
+        Values are shown in currency if given, otherwise in price_currency.
+        """
+        out = out or sys.stdout
+        if not self._data:
+            print("Please Add a data set first!", file=out)
+            return
+        out.write(self._cached(("display_cross_table", stat, currency, self._price_range),
+                               lambda: self._render_cross_table(stat, currency)))
+
+    @_instrumented("render_cross_table")
+    def _render_cross_table(self, stat: Stats, currency=None):
+        property_labels, rows = self.cross_table(stat, currency)
+        lines = ["                " + "".join(f"{item:20}" for item in property_labels)]
+        for location, values in rows:
+            lines.append(f" {location:15}" + "".join(
+                _money_cell('N/A' if value is None else value, currency)
+                for value in values))
+        return "\n".join(lines) + "\n"
+
+    @_instrumented("export_cross_table")
+    @_reads
+    def export_cross_table(self, stat: Stats, export_format=None, out=None, currency=None):
+        """ Export the cross table for stat as CSV (the default) or JSON.
+        Missing values are empty CSV fields or JSON nulls. Writes to out if
+        given, and returns the exported text.
+        """
+        property_labels, rows = self.cross_table(stat, currency)
+        if export_format is DataSet.ExportFormat.JSON:
+            text = json.dumps({
+                "stat": stat.name,
+                "currency": currency or self.price_currency,
+                "columns": property_labels,
+                "rows": {location: dict(zip(property_labels, values))
+                         for location, values in rows},
+            }, indent=2) + "\n"
+        else:
+            text = _csv_text([["location", *property_labels]] +
+                             [[location, *values] for location, values in rows])
+        if out is not None:
+            out.write(text)
+        return text
 
     def _alternate_category_type(self, first_category_type):
         """ Given one of the two Category Enum entries, return the
@@ -172,7 +1998,8 @@ class DataSet(object):
             second_category_type = self.Categories.LOCATION
         return second_category_type
 
-    def _table_statistics(self, row_category: Categories, descriptor: str):
+    @_reads
+    def _table_statistics(self, row_category: Categories, descriptor: str, stats=None):
         """ Given a category and a label from that category, calculate
         summary statistics for the rows that match that label.
         Include only rows where the alternate category's label is
@@ -180,63 +2007,147 @@ class DataSet(object):
         Keyword arguments:
         row_category -- a category from the Categories Enum
         descriptor -- a label from row_category
-        Returns a tuple of min, average, max from the matching rows.
+        stats -- optional sequence of Stats to return instead of min, avg, max
+        Returns a tuple of min, average, max (or of stats) from the matching rows.
         """
         try:
             if not self._data:
                 raise DataSet.EmptyDatasetError
-            detail_category = self._alternate_category_type(row_category)
-            value_list = [item[2] for item in self._data if
-                          item[row_category.value] == descriptor and
-                          item[detail_category.value] in
-                          self._active_labels[detail_category]]
-            if len(value_list) == 0:
-                return None, None, None
-            return min(value_list), sum(value_list) / len(value_list), \
-                max(value_list)
+            if self._price_range is None:
+                aggregate = self._filtered[row_category].get(descriptor)
+            else:
+                aggregate = self._range_aggregate(row_category, descriptor)
+            if stats is None:
+                if aggregate is None:
+                    return None, None, None
+                return aggregate.statistics()
+            if aggregate is None:
+                return (None,) * len(stats)
+            values = aggregate.statistics()
+            return tuple(aggregate.quantile(_QUANTILES[stat]) if stat in _QUANTILES
+                         else values[stat.value] for stat in stats)
         except DataSet.EmptyDatasetError:
             print("Please Add a data set first!")
 
-    def display_field_table(self, rows: Categories):
+    @_instrumented("field_table")
+    @_reads
+    def field_table(self, rows: Categories, currency=None, stats=None):
+        """ Returns the field table for a category as a tuple of the active
+        labels of the alternate category and a tuple of
+        (label, (min, avg, max)) rows in label order, converted into
+        currency if one is given. stats selects other columns than
+        min, avg, max. Like cross_table(), the result is built of tuples.
+        """
+        if not self._data:
+            raise DataSet.EmptyDatasetError
+        return self._cached(("field_table", rows, currency, tuple(stats) if stats else None,
+                             self._filter_state()),
+                            lambda: self._compute_field_table(rows, currency, stats))
+
+    @_instrumented("aggregate_field_table")
+    def _compute_field_table(self, rows: Categories, currency=None, stats=None):
+        rate = _conversion_rate(self.price_currency, currency or self.price_currency)
+        detail_category = self._alternate_category_type(rows)
+        return tuple(self.get_active_labels(detail_category)), \
+            tuple((descriptor, _scale_values(self._table_statistics(rows, descriptor, stats),
+                                             rate))
+                  for descriptor in self._sorted_labels[rows])
+
+    @_instrumented("display_field_table")
+    @_reads
+    def display_field_table(self, rows: Categories, out=None, currency=None, stats=None):
         """ Given a category, display one row for each label in that
-        category with min, avg, max displayed for each row.
-        Include only rows where the alternate category's label is active
+        category with min, avg, max (or the given stats) displayed for each row.
+        Include only rows where the alternate category's label is active.
+        The table is built in memory and written to out (stdout by default) at once.
+        Values are shown in currency if given, otherwise in price_currency.
         """
-        try:
-            if not self._data:
-                raise DataSet.EmptyDatasetError
-            detail_category = self._alternate_category_type(rows)
-            print("The following data are from properties "
-                  "matching these criteria:")
-            for label in self.get_active_labels(detail_category):
-                print(f"- {label}")
-            print(f"                    Minimum             Average             Maximum ")
-
-            for descriptor in DataSet.bubble_sort(self._labels[rows]):
-                min_value, avg_value, max_value = \
-                    self._table_statistics(rows, descriptor)
-                print(f"{descriptor:20}", end="")
-                if min_value is None:
-                    print(f"{'N/A':20}{'N/A':20}{'N/A':20}", end="")
-                else:
-                    print(f"$ {min_value:<18.2f}$ {avg_value:<18.2f}$ "
-                          f"{max_value:<18.2f}", end="")
-                print()
-        except DataSet.EmptyDatasetError:
-            print("Please Add a data set first!")
+        out = out or sys.stdout
+        stats = tuple(stats or _DEFAULT_FIELD_STATS)
+        if not self._data:
+            print("Please Add a data set first!", file=out)
+            return
+        out.write(self._cached(("display_field_table", rows, currency, stats,
+                                self._filter_state()),
+                               lambda: self._render_field_table(rows, currency, stats)))
+
+    @_instrumented("render_field_table")
+    def _render_field_table(self, rows: Categories, currency, stats):
+        criteria, table_rows = self.field_table(rows, currency, stats)
+        titles = [_STAT_TITLES[stat] for stat in stats]
+        lines = ["The following data are from properties matching these criteria:"]
+        lines.extend(f"- {label}" for label in criteria)
+        if self._price_range is not None:
+            low, high = ("any" if bound is None else bound for bound in self._price_range)
+            lines.append(f"- Price from {low} to {high} {self.price_currency}")
+        lines.append(" " * 20 + "".join(f"{title:20}" for title in titles[:-1]) +
+                     f"{titles[-1]} ")
+        for descriptor, values in table_rows:
+            if values[0] is None:
+                lines.append(f"{descriptor:20}" + "".join(f"{'N/A':20}" for _ in values))
+            else:
+                lines.append(f"{descriptor:20}" + "".join(
+                    _money_cell(value, currency) for value in values))
+        return "\n".join(lines) + "\n"
+
+    @_instrumented("export_field_table")
+    @_reads
+    def export_field_table(self, rows: Categories, export_format=None, out=None,
+                           currency=None, stats=None):
+        """ Export the field table for a category as CSV (the default) or
+        JSON. Missing values are empty CSV fields or JSON nulls. Writes to
+        out if given, and returns the exported text.
+        """
+        stats = stats or _DEFAULT_FIELD_STATS
+        criteria, table_rows = self.field_table(rows, currency, stats)
+        names = [stat.name.lower() for stat in stats]
+        if export_format is DataSet.ExportFormat.JSON:
+            text = json.dumps({
+                "category": rows.name,
+                "currency": currency or self.price_currency,
+                "criteria": sorted(criteria),
+                "rows": {descriptor: dict(zip(names, values))
+                         for descriptor, values in table_rows},
+            }, indent=2) + "\n"
+        else:
+            text = _csv_text([[rows.name.lower()] + names] +
+                             [[descriptor, *values] for descriptor, values in table_rows])
+        if out is not None:
+            out.write(text)
+        return text
+
+    @_reads
+    def cube(self):
+        """Returns an AggregateCube with the LOCATION and PROPERTY_TYPE
+        dimensions, copied from the aggregation index, and the same active
+        labels."""
+        if not self._data:
+            raise DataSet.EmptyDatasetError
+        cube = AggregateCube(category.name for category in self.Categories)
+        for key, aggregate in self._index.items():
+            cell = cube._cells[key] = _Aggregate()
+            cell.merge(aggregate)
+        cube._cells_changed()
+        for category in self.Categories:
+            cube._active_labels[category.name] = set(self._active_labels[category])
+        return cube
 
+    @_reads
     def get_labels(self, category: Categories):
         """Returns a list of items in _labels[category]"""
         if not self._data:
             raise DataSet.EmptyDatasetError
         return list(self._labels[category])
 
+    @_reads
     def get_active_labels(self, category: Categories):
         """Returns a list of items in _active_labels[category]"""
         if not self._data:
             raise DataSet.EmptyDatasetError
         return list(self._active_labels[category])
 
+    @_instrumented("toggle_active_labels")
+    @_writes
     def toggle_active_labels(self, category: Categories, descriptor: str):
         """Does add if not exist or remove labels if existing from _active_labels,
         allowing user to filter out certain property types or locations.
@@ -247,23 +2158,361 @@ class DataSet(object):
             if descriptor not in self._labels[category]:
                 raise KeyError
             elif descriptor in self._labels[category]:
+                added = descriptor not in self._active_labels[category]
                 self._active_labels[category].add(descriptor) \
-                    if descriptor not in self._active_labels[category] else \
+                    if added else \
                     self._active_labels[category].remove(descriptor)
+                self._update_filtered_totals(category, descriptor, added)
         except KeyError:
             print('The entry is non-existent!!!')
 
 
-def manage_filters(dataset: DataSet, category: DataSet.Categories):
+# Quantile of each sketch-backed statistic.
+_QUANTILES = {
+    DataSet.Stats.MEDIAN: .5,
+    DataSet.Stats.P90: .9,
+    DataSet.Stats.P99: .99
+}
+_STAT_TITLES = {
+    DataSet.Stats.MIN: "Minimum",
+    DataSet.Stats.AVG: "Average",
+    DataSet.Stats.MAX: "Maximum",
+    DataSet.Stats.MEDIAN: "Median",
+    DataSet.Stats.P90: "90th Percentile",
+    DataSet.Stats.P99: "99th Percentile"
+}
+_DEFAULT_FIELD_STATS = (DataSet.Stats.MIN, DataSet.Stats.AVG, DataSet.Stats.MAX)
+
+
+def _money_cell(value, currency=None):
+    """Returns a 20 character table cell for a price or 'N/A', prefixed
+    with $ for US dollars and with the currency code otherwise."""
+    prefix = "$ " if currency in (None, "USD") else f"{currency} "
+    width = 20 - len(prefix)
+    if isinstance(value, str):
+        return f"{prefix}{value:<{width}}"
+    return f"{prefix}{value:<{width}.2f}"
+
+
+def _scale_values(values, rate: float):
+    """Returns a tuple of values multiplied by rate, leaving None in place."""
+    if rate == 1:
+        return tuple(values)
+    return tuple(None if value is None else value * rate for value in values)
+
+
+def _csv_text(rows):
+    """Returns rows formatted as CSV text, with None written as an empty field."""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(
+        ["" if value is None else value for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def _aggregate_statistic(aggregate, stat):
+    """Returns one statistic of an _Aggregate, or None for a missing one."""
+    if aggregate is None:
+        return None
+    if stat in _QUANTILES:
+        return aggregate.quantile(_QUANTILES[stat])
+    return aggregate.statistics()[stat.value]
+
+
+class AggregateCube(object):
+    """Price aggregates over any number of category columns.
+
+    The finest cells hold one _Aggregate per combination of labels seen in
+    the data, and no rows are kept. A roll-up onto fewer dimensions is
+    merged from the smallest already built roll-up (or the finest cells)
+    that covers them, and cached until the cells change.
+
+    Every dimension has active labels, as with DataSet. A table over some
+    dimensions only counts cells whose labels are active in each of the
+    other dimensions, and lists every label of its own dimensions.
+    """
+
+    def __init__(self, dimensions):
+        self.dimensions = tuple(dimensions)
+        if len(set(self.dimensions)) != len(self.dimensions) or not self.dimensions:
+            raise ValueError("Dimensions must be distinct and not empty")
+        self._lock = _ReadWriteLock()
+        self._cells = {}
+        self._rollups = {}
+        self._labels = {name: set() for name in self.dimensions}
+        self._active_labels = {name: set() for name in self.dimensions}
+
+    @classmethod
+    def from_csv(cls, source, dimensions: dict, price_column=DEFAULT_COLUMNS[2], buckets=None):
+        """Build a cube from a CSV path or file object in one pass.
+
+        Keyword arguments:
+            dimensions -- maps each dimension name to its column, a position
+                          or a header name
+            price_column -- the position or header name of the price field
+            buckets -- optionally maps dimension names to a callable turning
+                       the field text into the label, e.g. a range of nights
+        """
+        cube = cls(dimensions)
+        buckets = buckets or {}
+        with DataSet._open_text(source) as csv_file:
+            csv_reader = csv.reader(csv_file)
+            header = next(csv_reader, None)
+            if header is None:
+                return cube
+            positions = [header.index(column) if isinstance(column, str) else column
+                         for column in list(dimensions.values()) + [price_column]]
+            price = positions.pop()
+            labelers = [buckets.get(name) for name in cube.dimensions]
+            cells = cube._cells
+            for line in csv_reader:
+                key = tuple(line[position] if labeler is None else labeler(line[position])
+                            for position, labeler in zip(positions, labelers))
+                cell = cells.get(key)
+                if cell is None:
+                    cell = cells[key] = _Aggregate()
+                cell.add(int(line[price]))
+        cube._cells_changed()
+        return cube
+
+    @_writes
+    def add_rows(self, rows):
+        """Fold rows of one label per dimension followed by the price into
+        the cells. New labels start active."""
+        cells = self._cells
+        for *labels, price in rows:
+            key = tuple(labels)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = _Aggregate()
+            cell.add(price)
+        self._cells_changed()
+
+    def _cells_changed(self):
+        self._rollups.clear()
+        for position, name in enumerate(self.dimensions):
+            labels = {key[position] for key in self._cells}
+            self._active_labels[name] |= labels - self._labels[name]
+            self._labels[name] = labels
+
+    def _positions(self, names):
+        try:
+            return tuple(sorted(self.dimensions.index(name) for name in names))
+        except ValueError:
+            raise KeyError(next(name for name in names if name not in self.dimensions))
+
+    def _rollup(self, positions: tuple):
+        """Returns the cells merged onto the dimensions at positions, keyed
+        by their labels in dimension order."""
+        if len(positions) == len(self.dimensions):
+            return self._cells
+        rollup = self._rollups.get(positions)
+        if rollup is not None:
+            return rollup
+        wanted = set(positions)
+        source_positions = min((cached for cached in list(self._rollups) if wanted <= set(cached)),
+                               key=len, default=tuple(range(len(self.dimensions))))
+        source = self._rollup(source_positions)
+        picks = [source_positions.index(position) for position in positions]
+        rollup = {}
+        for key, cell in source.items():
+            key = tuple(key[pick] for pick in picks)
+            aggregate = rollup.get(key)
+            if aggregate is None:
+                aggregate = rollup[key] = _Aggregate()
+            aggregate.merge(cell)
+        self._rollups[positions] = rollup
+        return rollup
+
+    @_reads
+    def rollup(self, names):
+        """Returns a dict from label tuples, in the order of names, to the
+        _Aggregate of the matching cells, ignoring the active labels."""
+        positions = self._positions(names)
+        order = [positions.index(self.dimensions.index(name)) for name in names]
+        return {tuple(key[i] for i in order): aggregate
+                for key, aggregate in self._rollup(positions).items()}
+
+    def _filtered(self, names):
+        """Returns the roll-up onto names, keyed in dimension order, of the
+        cells whose labels in every other dimension are active."""
+        filters = [position for position, name in enumerate(self.dimensions)
+                   if name not in names and self._active_labels[name] != self._labels[name]]
+        positions = self._positions(names)
+        if not filters:
+            return self._rollup(positions)
+        source_positions = tuple(sorted(positions + tuple(filters)))
+        checks = [(source_positions.index(position),
+                   self._active_labels[self.dimensions[position]]) for position in filters]
+        picks = [source_positions.index(position) for position in positions]
+        filtered = {}
+        for key, cell in self._rollup(source_positions).items():
+            if all(key[check] in active for check, active in checks):
+                key = tuple(key[pick] for pick in picks)
+                aggregate = filtered.get(key)
+                if aggregate is None:
+                    aggregate = filtered[key] = _Aggregate()
+                aggregate.merge(cell)
+        return filtered
+
+    @_reads
+    def cross_table(self, row_dimension: str, column_dimension: str, stat, currency=None):
+        """Returns the sorted labels of column_dimension and a tuple of
+        (row label, values) rows, with one statistic (or None) per column
+        label, as DataSet.cross_table does for its two categories."""
+        if row_dimension == column_dimension:
+            raise ValueError("A cross table needs two different dimensions")
+        cells = self._filtered((row_dimension, column_dimension))
+        swapped = self.dimensions.index(row_dimension) > self.dimensions.index(column_dimension)
+        rate = _conversion_rate(DataSet.price_currency, currency or DataSet.price_currency)
+        columns = tuple(sorted(self._labels[column_dimension]))
+        rows = []
+        for row_label in sorted(self._labels[row_dimension]):
+            keys = [(column, row_label) if swapped else (row_label, column) for column in columns]
+            rows.append((row_label, _scale_values(
+                [_aggregate_statistic(cells.get(key), stat) for key in keys], rate)))
+        return columns, tuple(rows)
+
+    @_reads
+    def field_table(self, dimension: str, stats=_DEFAULT_FIELD_STATS, currency=None):
+        """Returns the active labels of the other dimensions, by dimension,
+        and a tuple of (label, values) rows for every label of dimension,
+        with one value (or None) per stat."""
+        cells = self._filtered((dimension,))
+        rate = _conversion_rate(DataSet.price_currency, currency or DataSet.price_currency)
+        criteria = {name: sorted(self._active_labels[name])
+                    for name in self.dimensions if name != dimension}
+        return criteria, tuple(
+            (label, _scale_values([_aggregate_statistic(cells.get((label,)), stat)
+                                   for stat in stats], rate))
+            for label in sorted(self._labels[dimension]))
+
+    @_reads
+    def get_labels(self, dimension: str):
+        """Returns a list of the labels of dimension."""
+        return list(self._labels[dimension])
+
+    @_reads
+    def get_active_labels(self, dimension: str):
+        """Returns a list of the active labels of dimension."""
+        return list(self._active_labels[dimension])
+
+    @_writes
+    def toggle_active_labels(self, dimension: str, label: str):
+        """Activates label in dimension if it is inactive and deactivates it
+        otherwise. Raises KeyError for an unknown dimension or label."""
+        if label not in self._labels[dimension]:
+            raise KeyError(label)
+        active = self._active_labels[dimension]
+        if label in active:
+            active.remove(label)
+        else:
+            active.add(label)
+
+
+def _file_digest(path):
+    """Returns the SHA-256 hex digest of the file at path."""
+    import hashlib
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_cache(path, columns, rows: _ColumnarRows, listings, id_column, digest=None):
+    """Write rows and their _ListingHeaps to the binary cache beside path.
+
+    The cache holds a JSON header (the source size, mtime and SHA-256, the
+    column mapping, the label dictionaries and the listing heaps) followed
+    by the raw code and price arrays. It is written to a temporary file and moved into place, and
+    a cache that cannot be written is simply skipped.
+    """
+    cache_path = os.fspath(path) + CACHE_SUFFIX
+    try:
+        stat = os.stat(path)
+        meta = json.dumps({
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest or _file_digest(path),
+            "columns": list(columns),
+            "itemsizes": [rows.locations.itemsize, rows.prices.itemsize],
+            "rows": len(rows),
+            "labels": rows.labels,
+            "id_column": id_column,
+            "listing_count": listings.k,
+            "listings": listings.state(),
+        }).encode()
+        with open(cache_path + '.tmp', 'wb') as cache_file:
+            cache_file.write(_CACHE_MAGIC + struct.pack('<I', len(meta)) + meta)
+            rows.locations.tofile(cache_file)
+            rows.property_types.tofile(cache_file)
+            rows.prices.tofile(cache_file)
+        os.replace(cache_path + '.tmp', cache_path)
+    except OSError:
+        pass
+
+
+def _read_cache(path, columns, id_column):
+    """Returns the cached _ColumnarRows and _ListingHeaps for path, or None
+    if there is no usable cache.
+
+    The cache is used when the file's size and mtime match the ones
+    recorded. When only the mtime differs the file is hashed, and a matching
+    SHA-256 refreshes the recorded mtime instead of rebuilding.
+    """
+    try:
+        with open(os.fspath(path) + CACHE_SUFFIX, 'rb') as cache_file:
+            if cache_file.read(len(_CACHE_MAGIC)) != _CACHE_MAGIC:
+                return None
+            meta_length, = struct.unpack('<I', cache_file.read(4))
+            meta = json.loads(cache_file.read(meta_length))
+            if meta["columns"] != list(columns) or meta["id_column"] != id_column or \
+                    meta["listing_count"] != DEFAULT_LISTING_COUNT or \
+                    meta["itemsizes"] != [array('I').itemsize, array('l').itemsize]:
+                return None
+            stat = os.stat(path)
+            digest = None
+            if (meta["size"], meta["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+                if meta["size"] != stat.st_size:
+                    return None
+                digest = _file_digest(path)
+                if digest != meta["sha256"]:
+                    return None
+            columns_read = []
+            for typecode in ('I', 'I', 'l'):
+                column = array(typecode)
+                column.fromfile(cache_file, meta["rows"])
+                columns_read.append(column)
+    except (OSError, EOFError, ValueError, KeyError, struct.error):
+        return None
+    rows = _ColumnarRows.from_columns(meta["labels"], *columns_read)
+    listings = _ListingHeaps.from_state(meta["listing_count"], meta["listings"])
+    if digest is not None:
+        _write_cache(path, columns, rows, listings, id_column, digest)
+    return rows, listings
+
+
+def _load_shard(job):
+    """Process pool entry point for DataSet.load_files: parse one shard
+    into its rows, partial aggregation index and listing heaps."""
+    path, columns, chunk_size, columnar, id_column = job
+    return DataSet._parse_source(path, columns, chunk_size, columnar, id_column=id_column)
+
+
+def manage_filters(dataset: DataSet, category: DataSet.Categories, out=None):
     """Prints a menu-like list of all labels for a given category indicating
     which whether the state is active or inactive and allowing user to make
-    necessary changes in a loop till done.
+    necessary changes in a loop till done. The listing and messages are
+    written to out (stdout by default); selections are read with input().
     """
+    out = out or sys.stdout
     while True:
-        print("The following labels are in the dataset:")
+        active_labels = set(dataset.get_active_labels(category))
+        lines = ["The following labels are in the dataset:"]
         for index, value in enumerate(dataset.get_labels(category), start=1):
-            print(f'{index}: {value:20}  ACTIVE' if value in dataset.get_active_labels(category)
-                  else f'{index}: {value:20}  INACTIVE')
+            lines.append(f'{index}: {value:20}  ACTIVE' if value in active_labels
+                         else f'{index}: {value:20}  INACTIVE')
+        out.write("\n".join(lines) + "\n")
         try:
             toggle_selection = int(input(
                 "Please select an item to toggle or enter a blank line when you are finished: "))
@@ -272,13 +2521,49 @@ def manage_filters(dataset: DataSet, category: DataSet.Categories):
                     dataset.toggle_active_labels(category, dataset.get_labels(category)[toggle_selection - 1])
                     continue
                 except IndexError:
-                    print('Value entered not within range, please enter a number from one of the options!!')
+                    print('Value entered not within range, please enter a number from one of the options!!',
+                          file=out)
             elif toggle_selection == "":
                 break
         except ValueError:
-            print("Please enter a number from one of the options or _ to terminate.")
+            print("Please enter a number from one of the options or _ to terminate.", file=out)
             break
-        print(dataset.get_active_labels(category))
+        print(dataset.get_active_labels(category), file=out)
+
+
+class _Prefetch(object):
+    """Loads the default data into a DataSet on a background thread, so
+    the data is ready, or nearly, once the user is through the prompts."""
+
+    def __init__(self, dataset: DataSet):
+        self.rows = 0
+        self.error = None
+        self._thread = threading.Thread(target=self._load, args=(dataset,),
+                                        name="prefetch", daemon=True)
+        self._thread.start()
+
+    def _load(self, dataset: DataSet):
+        try:
+            dataset.load_data(DEFAULT_DATA_FILE, progress=self._progress, cache=True)
+        except (OSError, ValueError, DataSet.EmptyDatasetError) as error:
+            self.error = error
+
+    def _progress(self, rows: int):
+        self.rows = rows
+
+    def wait(self, out=None):
+        """Return once the load is done, showing the rows read so far on out
+        (stdout by default) while it runs. A failed load is reported once."""
+        out = out or sys.stdout
+        if self._thread.is_alive():
+            while self._thread.is_alive():
+                out.write(f"\rLoading data... {self.rows} rows")
+                out.flush()
+                self._thread.join(.1)
+            out.write(f"\rLoading data... done{' ' * 16}\n")
+        if self.error is not None:
+            print(f"Loading the data failed: {self.error}", file=out)
+            self.error = None
 
 
 def print_menu():
@@ -293,10 +2578,13 @@ def print_menu():
     print(7, "- ", "Adjust Property Type Filters ")
     print(8, "- ", "Load Data ")
     print(9, "- ", "Quit ")
+    print(10, "- ", "Print Most and Least Expensive Listings ")
 
 
-def menu(dataset):
-    """ Present user with option to access the Airbnb dataset. """
+def menu(dataset, prefetch=None):
+    """ Present user with option to access the Airbnb dataset. If a
+    _Prefetch is given, options other than quitting first wait for it.
+    """
     currency_options(home_currency)
     print()
     while True:
@@ -308,49 +2596,59 @@ def menu(dataset):
         except ValueError:
             print("Please enter a number only")
             continue
-        if selection == 1:
-            try:
-                dataset.display_cross_table(DataSet.Stats.AVG)
-            except dataset.EmptyDatasetError:
-                print("Please Load Dataset First!!")
-        elif selection == 2:
-            try:
-                dataset.display_cross_table(DataSet.Stats.MIN)
-            except dataset.EmptyDatasetError:
-                print("Please Load a Dataset First!!")
-        elif selection == 3:
-            try:
-                dataset.display_cross_table(DataSet.Stats.MAX)
-            except dataset.EmptyDatasetError:
-                print("Please Load a Dataset First!!")
-        elif selection == 4:
-            try:
-                dataset.display_field_table(DataSet.Categories.PROPERTY_TYPE)
-            except dataset.EmptyDatasetError:
-                print("Please Load a Dataset First!!")
-        elif selection == 5:
-            try:
-                dataset.display_field_table(DataSet.Categories.LOCATION)
-            except dataset.EmptyDatasetError:
-                print("Please Load a Dataset First!!")
-        elif selection == 6:
-            try:
-                manage_filters(dataset=dataset, category=dataset.Categories.LOCATION)
-            except dataset.EmptyDatasetError:
-                print("Please Load a Dataset First!!")
-        elif selection == 7:
-            try:
-                manage_filters(dataset=dataset, category=dataset.Categories.PROPERTY_TYPE)
-            except dataset.EmptyDatasetError:
-                print("Please Load a Dataset First!!")
-        elif selection == 8:
-            dataset.load_default_data()
-            print("Data Loaded Successfully!")
-        elif selection == 9:
-            print("Goodbye!  Thank you for using the database")
-            break
-        else:
-            print("Please enter a number between 1 and 9")
+        if prefetch is not None and selection != 9:
+            prefetch.wait()
+        with dataset._operation(f"menu option {selection}"):
+            if selection == 1:
+                try:
+                    dataset.display_cross_table(DataSet.Stats.AVG, currency=home_currency or None)
+                except dataset.EmptyDatasetError:
+                    print("Please Load Dataset First!!")
+            elif selection == 2:
+                try:
+                    dataset.display_cross_table(DataSet.Stats.MIN, currency=home_currency or None)
+                except dataset.EmptyDatasetError:
+                    print("Please Load a Dataset First!!")
+            elif selection == 3:
+                try:
+                    dataset.display_cross_table(DataSet.Stats.MAX, currency=home_currency or None)
+                except dataset.EmptyDatasetError:
+                    print("Please Load a Dataset First!!")
+            elif selection == 4:
+                try:
+                    dataset.display_field_table(DataSet.Categories.PROPERTY_TYPE, currency=home_currency or None)
+                except dataset.EmptyDatasetError:
+                    print("Please Load a Dataset First!!")
+            elif selection == 5:
+                try:
+                    dataset.display_field_table(DataSet.Categories.LOCATION, currency=home_currency or None)
+                except dataset.EmptyDatasetError:
+                    print("Please Load a Dataset First!!")
+            elif selection == 6:
+                try:
+                    manage_filters(dataset=dataset, category=dataset.Categories.LOCATION)
+                except dataset.EmptyDatasetError:
+                    print("Please Load a Dataset First!!")
+            elif selection == 7:
+                try:
+                    manage_filters(dataset=dataset, category=dataset.Categories.PROPERTY_TYPE)
+                except dataset.EmptyDatasetError:
+                    print("Please Load a Dataset First!!")
+            elif selection == 8:
+                dataset.load_default_data()
+                print("Data Loaded Successfully!")
+            elif selection == 9:
+                print("Goodbye!  Thank you for using the database")
+                break
+            elif selection == 10:
+                try:
+                    dataset.display_extreme_listings(currency=home_currency or None)
+                except dataset.EmptyDatasetError:
+                    print("Please Load a Dataset First!!")
+                except ValueError as error:
+                    print(error)
+            else:
+                print("Please enter a number between 1 and 10")
 
 
 def currency_converter(quantity: float, source_curr: str, target_curr: str):
@@ -363,27 +2661,83 @@ def currency_converter(quantity: float, source_curr: str, target_curr: str):
     return in_target
 
 
-def currency_options(base_curr="EUR"):
+def rate_matrix():
+    """ Returns a tuple of the currency codes in conversions and an N x N
+    list of rates, where rates[i][j] converts an amount in currencies[i]
+    into currencies[j]. The matrix is computed once and rebuilt only when
+    conversions changes.
+    """
+    global _rate_matrix
+    key = tuple(conversions.items())
+    if _rate_matrix is None or _rate_matrix[0] != key:
+        currencies = list(conversions)
+        rates = [[conversions[target] / conversions[source] for target in currencies]
+                 for source in currencies]
+        positions = {currency: position for position, currency in enumerate(currencies)}
+        _rate_matrix = key, currencies, rates, positions
+    return _rate_matrix[1], _rate_matrix[2]
+
+
+def _conversion_rate(source_curr: str, target_curr: str):
+    """ Returns the rate from the matrix converting source_curr into
+    target_curr, raising ValueError for an unknown currency. """
+    if source_curr not in conversions or target_curr not in conversions:
+        raise ValueError
+    rates = rate_matrix()[1]
+    positions = _rate_matrix[3]
+    return rates[positions[source_curr]][positions[target_curr]]
+
+
+def currency_converter_batch(quantities, source_curr: str, target_curr: str):
+    """ Converts every amount in quantities from source_curr into target_curr
+    with one rate taken from rate_matrix(). The currencies and amounts are
+    validated once for the whole batch, with the same rules as
+    currency_converter. A NumPy array or array.array comes back as the same
+    kind of array (of floats); any other iterable comes back as a list.
+    Results can differ from currency_converter in the last bit, since the
+    rate is applied as one multiplication.
+    """
+    rate = _conversion_rate(source_curr, target_curr)
+    # Only an already imported numpy can have made quantities.
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(quantities, np.ndarray):
+        if quantities.size and (quantities <= 0).any():
+            raise ValueError
+        return quantities * rate
+    if not isinstance(quantities, (list, tuple, array)):
+        quantities = list(quantities)
+    if len(quantities) and min(quantities) <= 0:
+        raise ValueError
+    if isinstance(quantities, array):
+        return array('d', [quantity * rate for quantity in quantities])
+    return [quantity * rate for quantity in quantities]
+
+
+def currency_options(base_curr="EUR", out=None):
     """ Print out a table of options for converting base_curr to all
     other currencies
     """
-    print(f"Options for converting from {base_curr}:")
-    for target in conversions:
-        print(f"{target:10}", end="")
-    print()
+    lines = [f"Options for converting from {base_curr}:",
+             "".join(f"{target:10}" for target in conversions)]
     for i in range(10, 100, 10):
-        for target in conversions:
-            print(f"{currency_converter(i, base_curr, target):<10.2f}", end="")
-        print()
+        lines.append("".join(f"{currency_converter(i, base_curr, target):<10.2f}"
+                             for target in conversions))
+    (out or sys.stdout).write("\n".join(lines) + "\n")
 
 
-def main():
+def main(profile_path=None):
     """ Obtain the user's name, welcome them to the project, and then
     call the menu function to display a selection menu for the user
-    to choose from.
+    to choose from. The default data is loaded in the background from
+    the start. With profile_path, the session is instrumented; the
+    operation totals are printed on quit and the cProfile data is saved
+    to profile_path.
     """
 
     air_bnb = DataSet()
+    if profile_path:
+        air_bnb.enable_instrumentation(memory=True, profile=True)
+    prefetch = _Prefetch(air_bnb)
 
     global home_currency
     name = input("Please enter your name: ")
@@ -399,8 +2753,234 @@ def main():
             header = air_bnb.header
 
     print(air_bnb.header)
-    menu(air_bnb)
+    menu(air_bnb, prefetch)
+    instrumentation = air_bnb.disable_instrumentation()
+    if instrumentation is not None:
+        instrumentation.report()
+        instrumentation.dump_profile(profile_path)
+
+
+# The service imports asyncio where it is used, which keeps that import,
+# one of the slowest in the program, off the interactive startup path.
+class ReportService(object):
+    """Serves the menu actions as request/response operations, so many
+    clients can share one DataSet without blocking each other.
+
+    A request is a dict with an "action" key and the action's arguments;
+    the response is {"ok": True, "result": ...} or {"ok": False,
+    "error": message}. Reports answered from the result cache while the
+    DataSet lock is free are sent at once; every other DataSet call, from
+    table builds to filter changes, runs in the executor, so one waiting
+    on the lock or doing real work never stalls the other clients.
+
+    Loads parse a file of data_directory (by default the directory of
+    DEFAULT_DATA_FILE) into a new DataSet, which takes over the price
+    range and replaces the served one once it is complete, so reports
+    keep being answered from the old data while a load is running.
+    """
+
+    def __init__(self, dataset=None, executor=None, data_directory=None):
+        import asyncio
+        self.dataset = dataset if dataset is not None else DataSet()
+        self.data_directory = os.path.realpath(
+            data_directory or os.path.dirname(os.path.abspath(DEFAULT_DATA_FILE)))
+        self._executor = executor
+        self._load_lock = asyncio.Lock()
+        self._actions = {
+            "cross_table": self._cross_table,
+            "field_table": self._field_table,
+            "labels": self._labels,
+            "toggle_filter": self._toggle_filter,
+            "price_range": self._price_range,
+            "listings": self._listings,
+            "load": self._load,
+            "convert_currency": self._convert_currency,
+        }
+
+    async def handle(self, request: dict):
+        """Run one request and return its response."""
+        try:
+            action = self._actions[request["action"]]
+        except (KeyError, TypeError):
+            return {"ok": False, "error": "Unknown action"}
+        try:
+            return {"ok": True, "result": await action(request)}
+        except DataSet.EmptyDatasetError:
+            return {"ok": False, "error": "Please Load a Dataset First!!"}
+        except KeyError as error:
+            return {"ok": False, "error": f"Unknown value: {error.args[0]}"}
+        except (TypeError, ValueError, OSError) as error:
+            return {"ok": False, "error": str(error) or type(error).__name__}
+
+    @staticmethod
+    def _member(enum, name: str):
+        return enum[str(name).upper()]
+
+    async def _run(self, function, *args, **kwargs):
+        """Returns the result of function(*args, **kwargs), run in the executor."""
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(function, *args, **kwargs))
+
+    async def _read(self, dataset: DataSet, function, *args, **kwargs):
+        """Returns the result of a read of dataset, run at once when it can
+        be answered without waiting or computing, see DataSet._try_read(),
+        and in the executor otherwise."""
+        done, result = dataset._try_read(function, *args, **kwargs)
+        if done:
+            return result
+        return await self._run(function, *args, **kwargs)
+
+    @staticmethod
+    def _text(display, *args, **kwargs):
+        """Returns what display writes to its out argument."""
+        out = io.StringIO()
+        display(*args, out=out, **kwargs)
+        return out.getvalue()
+
+    async def _cross_table(self, request: dict):
+        stat = self._member(DataSet.Stats, request.get("stat", "AVG"))
+        currency = request.get("currency")
+        dataset = self.dataset
+        if request.get("format") == "text":
+            return await self._read(dataset, self._text, dataset.display_cross_table, stat,
+                                    currency=currency)
+        columns, rows = await self._read(dataset, dataset.cross_table, stat, currency)
+        return {"columns": columns, "rows": rows}
+
+    async def _field_table(self, request: dict):
+        category = self._member(DataSet.Categories, request.get("category", "LOCATION"))
+        stats = [self._member(DataSet.Stats, stat) for stat in request["stats"]] \
+            if request.get("stats") else None
+        currency = request.get("currency")
+        dataset = self.dataset
+        if request.get("format") == "text":
+            return await self._read(dataset, self._text, dataset.display_field_table, category,
+                                    currency=currency, stats=stats)
+        criteria, rows = await self._read(dataset, dataset.field_table, category, currency,
+                                          stats or _DEFAULT_FIELD_STATS)
+        return {"criteria": sorted(criteria), "rows": rows}
+
+    @staticmethod
+    def _label_lists(dataset: DataSet, category):
+        return {"labels": sorted(dataset.get_labels(category)),
+                "active": sorted(dataset.get_active_labels(category))}
+
+    async def _labels(self, request: dict):
+        category = self._member(DataSet.Categories, request.get("category", "LOCATION"))
+        return await self._read(self.dataset, self._label_lists, self.dataset, category)
+
+    @staticmethod
+    def _toggle(dataset: DataSet, category, label: str):
+        if label not in dataset.get_labels(category):
+            raise KeyError(label)
+        dataset.toggle_active_labels(category, label)
+        return {"active": sorted(dataset.get_active_labels(category))}
+
+    async def _toggle_filter(self, request: dict):
+        category = self._member(DataSet.Categories, request.get("category", "LOCATION"))
+        return await self._run(self._toggle, self.dataset, category, request["label"])
+
+    @staticmethod
+    def _set_price_range(dataset: DataSet, low, high):
+        dataset.set_price_range(low, high)
+        return {"price_range": dataset.get_price_range()}
+
+    async def _price_range(self, request: dict):
+        return await self._run(self._set_price_range, self.dataset, request.get("low"),
+                               request.get("high"))
+
+    async def _listings(self, request: dict):
+        groups = await self._run(self.dataset.extreme_listings, int(request.get("k", 5)),
+                                 request.get("currency"))
+        return [{"location": location, "property_type": property_type,
+                 "top": top, "bottom": bottom}
+                for (location, property_type), top, bottom in groups]
+
+    def _data_path(self, path: str):
+        """Returns the real path of path within data_directory, or raises
+        ValueError if it lies outside, so clients cannot have any file read
+        or a cache written next to it."""
+        resolved = os.path.realpath(os.path.join(self.data_directory, path))
+        if os.path.commonpath([resolved, self.data_directory]) != self.data_directory:
+            raise ValueError(f"Only files in {self.data_directory} can be loaded")
+        return resolved
+
+    @staticmethod
+    def _carry_over(source: DataSet, target: DataSet):
+        """Give target the price range of source, as a reload from the menu keeps it."""
+        price_range = source.get_price_range()
+        if price_range is not None:
+            target.set_price_range(*price_range)
+
+    async def _load(self, request: dict):
+        path = self._data_path(str(request.get("path") or DEFAULT_DATA_FILE))
+        async with self._load_lock:
+            loaded = DataSet(self.dataset.header, self.dataset.storage)
+            await self._run(loaded.load_data, path, cache=True)
+            await self._run(self._carry_over, self.dataset, loaded)
+            self.dataset = loaded
+        return {"rows": len(loaded._data)}
+
+    async def _convert_currency(self, request: dict):
+        amounts = request["amounts"] if "amounts" in request else [request["amount"]]
+        converted = currency_converter_batch(amounts, request["source"], request["target"])
+        return converted if "amounts" in request else converted[0]
+
+    async def _serve_client(self, reader, writer):
+        """Answer newline-delimited JSON requests from one connection until
+        it closes."""
+        import asyncio
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = {"ok": False, "error": "Invalid JSON"}
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def start(self, host=DEFAULT_SERVICE_HOST, port=DEFAULT_SERVICE_PORT):
+        """Start listening for clients and return the asyncio server."""
+        import asyncio
+        return await asyncio.start_server(self._serve_client, host, port,
+                                          backlog=1024, limit=1 << 20)
+
+
+def serve(host=DEFAULT_SERVICE_HOST, port=DEFAULT_SERVICE_PORT, dataset=None,
+          data_directory=None):
+    """ Run a ReportService on host:port, loading files of data_directory,
+    until interrupted. """
+    import asyncio
+
+    async def run():
+        service = ReportService(dataset, data_directory=data_directory)
+        server = await service.start(host, port)
+        print(f"Serving reports on {host}:{server.sockets[0].getsockname()[1]}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["--serve"]:
+        serve(port=int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SERVICE_PORT)
+    elif sys.argv[1:2] == ["--profile"]:
+        main(sys.argv[2] if len(sys.argv) > 2 else "dataset.prof")
+    else:
+        main()
@@ -0,0 +1,271 @@
+#!/bin/python3
+# Description: Timing and memory comparisons for the DataSet storage modes.
+"""
+Run from the CS3A_Assignment directory, next to AB_NYC_2019.csv:
+
+    python3 benchmark.py [--synthetic-rows N]
+    python3 benchmark.py --suite [--scales 1,10,100] [--locations N --property-types N]
+                         [--repeat N] [--json FILE]
+
+--suite times the DataSet hot paths on the bundled data and on synthetic
+data sets of the given multiples of its size, and writes the results as
+JSON (to stdout unless --json names a file) for comparison across commits.
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from CS3A_Assignment import CACHE_SUFFIX, DEFAULT_COLUMNS, DEFAULT_DATA_FILE, DataSet, _numpy
+from CS3A_Assignment import currency_options
+
+
+def measure(function, repeat=5):
+    """Call function repeat times and return the best wall time in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def storage_comparison(repeat=5):
+    """Compare the tuple-list and columnar storage modes by the memory held
+    by the loaded rows, the time to load the file and the time to build
+    the aggregation index.
+    """
+    results = {}
+    for storage in DataSet.Storage:
+        dataset = DataSet(storage=storage)
+        tracemalloc.start()
+        dataset.load_data(DEFAULT_DATA_FILE)
+        data_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results[storage.name] = {
+            "rows": len(dataset._data),
+            "memory_bytes": data_bytes,
+            "load_seconds": measure(lambda: dataset.load_data(DEFAULT_DATA_FILE), repeat),
+            "index_seconds": measure(dataset._build_index, repeat),
+        }
+    return results
+
+
+def load_file_memory():
+    """Returns the rows returned by DataSet.load_file and the bytes they hold."""
+    tracemalloc.start()
+    rows = DataSet.load_file()
+    data_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {"rows": len(rows), "memory_bytes": data_bytes}
+
+
+def cache_comparison(repeat=5):
+    """Compare a cold load, which parses the CSV and writes the binary cache,
+    with a warm load served from that cache, for each storage mode.
+    """
+    cache_path = DEFAULT_DATA_FILE + CACHE_SUFFIX
+
+    def cold_load(dataset):
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        dataset.load_data(DEFAULT_DATA_FILE, cache=True)
+
+    results = {}
+    for storage in DataSet.Storage:
+        dataset = DataSet(storage=storage)
+        results[storage.name] = {
+            "cold_seconds": measure(lambda: cold_load(dataset), repeat),
+            "warm_seconds": measure(lambda: dataset.load_data(DEFAULT_DATA_FILE, cache=True),
+                                    repeat),
+        }
+    return results
+
+
+def write_synthetic_file(path, rows: int):
+    """Write a CSV file of rows lines by cycling through the bundled data."""
+    with open(DEFAULT_DATA_FILE, 'r', newline='') as source:
+        header, *lines = source.read().splitlines()
+    with open(path, 'w', newline='') as target:
+        target.write(header + "\r\n")
+        for line in itertools.islice(itertools.cycle(lines), rows):
+            target.write(line + "\r\n")
+
+
+def write_generated_file(path, rows: int, locations: int, property_types: int, seed=0):
+    """Write a CSV file of rows lines with locations and property_types
+    distinct labels and log-normally distributed prices, the same for a
+    given seed."""
+    generator = random.Random(seed)
+    location_labels = [f"Location {i:05}" for i in range(locations)]
+    property_labels = [f"Type {i:04}" for i in range(property_types)]
+    with open(path, 'w', newline='') as target:
+        target.write("id,neighbourhood_group,room_type,price\r\n")
+        for start in range(0, rows, 10000):
+            target.writelines(
+                f"{row},{generator.choice(location_labels)},"
+                f"{generator.choice(property_labels)},"
+                f"{int(generator.lognormvariate(4.7, .7))}\r\n"
+                for row in range(start, min(start + 10000, rows)))
+
+
+def hot_paths(path, repeat=5):
+    """Time the DataSet hot paths on the CSV file at path. Returns a dict
+    of the best wall time in seconds of each, plus the row and label counts.
+    The result cache is disabled, so the tables are rebuilt on every call.
+    """
+    dataset = DataSet()
+    dataset.result_cache_size = 0
+    load_repeat = max(1, repeat // 5)
+    results = {"load_file": measure(lambda: [row for chunk in DataSet.iter_chunks(path)
+                                              for row in chunk], load_repeat),
+               "load_data": measure(lambda: dataset.load_data(path), load_repeat),
+               "_initialize_sets": measure(dataset._initialize_sets, repeat)}
+    locations = dataset.get_labels(DataSet.Categories.LOCATION)
+    property_types = dataset.get_labels(DataSet.Categories.PROPERTY_TYPE)
+
+    def cross_cells():
+        for location in locations:
+            for property_type in property_types:
+                dataset._cross_table_statistics(location, property_type)
+
+    def field_rows():
+        for category in DataSet.Categories:
+            for label in dataset.get_labels(category):
+                dataset._table_statistics(category, label)
+
+    results.update({
+        "_cross_table_statistics": measure(cross_cells, repeat),
+        "_table_statistics": measure(field_rows, repeat),
+        "bubble_sort": measure(lambda: DataSet.bubble_sort(locations + property_types), repeat),
+        "display_cross_table": measure(
+            lambda: dataset.display_cross_table(DataSet.Stats.AVG, out=io.StringIO()), repeat),
+        "display_field_table": measure(
+            lambda: dataset.display_field_table(DataSet.Categories.LOCATION, out=io.StringIO()),
+            repeat),
+        "currency_options": measure(lambda: currency_options("EUR", out=io.StringIO()), repeat),
+    })
+    return {"rows": len(dataset._data), "locations": len(locations),
+            "property_types": len(property_types), "seconds": results}
+
+
+def benchmark_suite(scales=(1, 10), locations=None, property_types=None, repeat=5):
+    """Run hot_paths() on a file of scale times the bundled row count for
+    each scale. By default that is the bundled file itself for scale 1 and
+    a file cycling through its rows otherwise; when locations or
+    property_types set the label cardinality, every file is generated.
+    Returns a JSON-ready dict of the environment and the results per scale.
+    """
+    bundled_rows = len(DataSet.load_file())
+    np = _numpy()
+    suite = {"python": platform.python_version(), "platform": platform.platform(),
+             "numpy": np.__version__ if np is not None else None,
+             "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "repeat": repeat,
+             "results": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in scales:
+            rows = bundled_rows * scale
+            if locations is None and property_types is None:
+                if scale == 1:
+                    path = DEFAULT_DATA_FILE
+                else:
+                    path = os.path.join(directory, f"synthetic-{scale}.csv")
+                    write_synthetic_file(path, rows)
+            else:
+                path = os.path.join(directory, f"generated-{scale}.csv")
+                write_generated_file(path, rows, locations or 5, property_types or 3)
+            suite["results"][f"x{scale}"] = hot_paths(path, repeat)
+            if path != DEFAULT_DATA_FILE:
+                os.remove(path)
+    return suite
+
+
+def read_csv_rows(path=DEFAULT_DATA_FILE):
+    """Read path the way DataSet.load_file originally did: csv.reader over
+    the decoded text, building one (location, property type, price) tuple
+    per line."""
+    with open(path, 'r') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        return_list = []
+        next(csv_reader)
+        for line in csv_reader:
+            item = line[1], line[2], int(line[3])
+            return_list.append(item)
+        return return_list
+
+
+def scan_comparison(path=DEFAULT_DATA_FILE, repeat=3):
+    """Compare reading the rows of path with the original csv.reader loop
+    against the mmap scanner, neither aggregating them."""
+    csv_seconds = measure(lambda: read_csv_rows(path), repeat)
+    scan_seconds = measure(lambda: DataSet.scan_file(path), repeat)
+    return {"csv_seconds": csv_seconds, "scan_seconds": scan_seconds,
+            "speedup": csv_seconds / scan_seconds}
+
+
+def print_scan_comparison(name, result):
+    print(f"{name:10} csv.reader {result['csv_seconds'] * 1000:>9.2f} ms  "
+          f"mmap scan {result['scan_seconds'] * 1000:>9.2f} ms  "
+          f"x{result['speedup']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic-rows", type=int, default=0,
+                        help="also compare the CSV scanners on a generated file of this many rows")
+    parser.add_argument("--suite", action="store_true",
+                        help="run the hot path suite and emit JSON instead")
+    parser.add_argument("--scales", default="1,10",
+                        help="comma separated multiples of the bundled data size for --suite")
+    parser.add_argument("--locations", type=int, default=None,
+                        help="distinct locations in the --suite synthetic data")
+    parser.add_argument("--property-types", type=int, default=None,
+                        help="distinct property types in the --suite synthetic data")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="calls per measurement in --suite, keeping the best")
+    parser.add_argument("--json", default="-",
+                        help="file to write the --suite results to, - for stdout")
+    args = parser.parse_args()
+    if args.suite:
+        suite = benchmark_suite([int(scale) for scale in args.scales.split(",")],
+                                args.locations, args.property_types, args.repeat)
+        if args.json == "-":
+            json.dump(suite, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, 'w') as target:
+                json.dump(suite, target, indent=2)
+        return
+    for name, result in storage_comparison().items():
+        print(f"{name:10} {result['rows']:>9} rows  "
+              f"{result['memory_bytes'] / 2 ** 20:>8.2f} MiB  "
+              f"load {result['load_seconds'] * 1000:>8.2f} ms  "
+              f"index {result['index_seconds'] * 1000:>8.2f} ms")
+    result = load_file_memory()
+    print(f"{'load_file':10} {result['rows']:>9} rows  "
+          f"{result['memory_bytes'] / 2 ** 20:>8.2f} MiB")
+    for name, result in cache_comparison().items():
+        print(f"{name:10} cold load {result['cold_seconds'] * 1000:>8.2f} ms  "
+              f"warm load {result['warm_seconds'] * 1000:>8.2f} ms")
+    print_scan_comparison("bundled", scan_comparison())
+    if args.synthetic_rows:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "synthetic.csv")
+            write_synthetic_file(path, args.synthetic_rows)
+            print_scan_comparison(f"{args.synthetic_rows} rows", scan_comparison(path, repeat=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/bin/python3
+# Description: Throughput and latency measurements for the ReportService.
+"""
+Run from the CS3A_Assignment directory, next to AB_NYC_2019.csv:
+
+    python3 load_generator.py [--clients N] [--requests N] [--loads N] [--port PORT]
+
+Without --port an in-process service is started on a free port.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import time
+
+from CS3A_Assignment import DEFAULT_SERVICE_HOST, ReportService
+
+# Requests cycled through by each report client.
+REQUEST_MIX = (
+    {"action": "cross_table", "stat": "AVG"},
+    {"action": "field_table", "category": "LOCATION", "stats": ["MIN", "MEDIAN", "MAX"]},
+    {"action": "cross_table", "stat": "P90", "currency": "EUR"},
+    {"action": "labels", "category": "PROPERTY_TYPE"},
+    {"action": "convert_currency", "amounts": [10, 20, 30], "source": "USD", "target": "JPY"},
+    {"action": "field_table", "category": "PROPERTY_TYPE", "format": "text"},
+)
+
+
+async def request(reader, writer, payload: dict):
+    """Send one request and return the decoded response."""
+    writer.write(json.dumps(payload).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def client(host, port, requests: int, payloads, latencies: list, errors: list):
+    """Open one connection and send requests payloads on it, one at a time,
+    recording each round trip's latency in seconds."""
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    try:
+        for payload in itertools.islice(itertools.cycle(payloads), requests):
+            start = time.perf_counter()
+            response = await request(reader, writer, payload)
+            latencies.append(time.perf_counter() - start)
+            if not response["ok"]:
+                errors.append(response["error"])
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def percentile(ordered: list, q: float):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(host, port, clients: int, requests: int, loads: int):
+    """Drive clients report connections, plus loads connections that each
+    reload the data once, and return the measured figures."""
+    report_latencies, load_latencies, errors = [], [], []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(client(host, port, requests, REQUEST_MIX, report_latencies, errors)
+          for _ in range(clients)),
+        *(client(host, port, 1, [{"action": "load"}], load_latencies, errors)
+          for _ in range(loads)))
+    elapsed = time.perf_counter() - start
+    report_latencies.sort()
+    return {
+        "requests": len(report_latencies),
+        "errors": len(errors),
+        "seconds": elapsed,
+        "throughput": len(report_latencies) / elapsed,
+        "mean_ms": statistics.fmean(report_latencies) * 1000,
+        "p50_ms": percentile(report_latencies, .5) * 1000,
+        "p99_ms": percentile(report_latencies, .99) * 1000,
+        "max_ms": report_latencies[-1] * 1000,
+        "load_ms": max(load_latencies, default=0) * 1000,
+    }
+
+
+async def main_async(args):
+    server = None
+    port = args.port
+    if port is None:
+        service = ReportService()
+        server = await service.start(args.host, 0)
+        port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection(args.host, port)
+        await request(reader, writer, {"action": "load"})
+        writer.close()
+        await writer.wait_closed()
+        return await run(args.host, port, args.clients, args.requests, args.loads)
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default=DEFAULT_SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=None,
+                        help="port of a running service; starts one in-process if omitted")
+    parser.add_argument("--clients", type=int, default=200,
+                        help="concurrent report connections")
+    parser.add_argument("--requests", type=int, default=50,
+                        help="requests sent by each report connection")
+    parser.add_argument("--loads", type=int, default=2,
+                        help="connections that reload the data while the reports run")
+    result = asyncio.run(main_async(parser.parse_args()))
+    print(f"{result['requests']} requests ({result['errors']} errors) in "
+          f"{result['seconds']:.2f} s: {result['throughput']:.0f} requests/s")
+    print(f"latency mean {result['mean_ms']:.2f} ms  p50 {result['p50_ms']:.2f} ms  "
+          f"p99 {result['p99_ms']:.2f} ms  max {result['max_ms']:.2f} ms")
+    print(f"slowest load {result['load_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,21 @@
+import asyncio
+import bz2
+import contextlib
+import gzip
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
-from CS3A_Assignment import DataSet as dataset
+from unittest import mock
+from array import array
+from CS3A_Assignment import DataSet as dataset, DEFAULT_LISTING_COUNT
+from CS3A_Assignment import AggregateCube, ReportService, _Prefetch, manage_filters
+from CS3A_Assignment import currency_converter, currency_converter_batch, rate_matrix
 
 
 class TestStringMethods(unittest.TestCase):
@@ -117,6 +133,972 @@ class TestStringMethods(unittest.TestCase):
             self.assertFalse(result)
         self.assertTrue(result)
 
+    """
+    ***********************************************
+    * Tests for the aggregation index begin here. *
+    ***********************************************
+    """
+    def test_index_matches_full_scan(self):
+        self._dataset.load_default_data()
+        for descriptor_one, descriptor_two in self._dataset._index:
+            value_list = [item[2] for item in self._dataset._data if
+                          item[0] == descriptor_one and item[1] == descriptor_two]
+            expected = (min(value_list), sum(value_list) / len(value_list),
+                        max(value_list))
+            self.assertEqual(self._dataset._cross_table_statistics(
+                descriptor_one, descriptor_two), expected)
+
+    def test_index_covers_every_row(self):
+        self._dataset.load_default_data()
+        total = sum(aggregate.count for aggregate in self._dataset._index.values())
+        self.assertEqual(total, len(self._dataset._data))
+
+    def test_index_missing_pair_returns_none_tuple(self):
+        self._dataset.load_default_data()
+        result = self._dataset._cross_table_statistics("Bronx", "Gooakakkakkakaak")
+        self.assertEqual(result, (None, None, None))
+
+    """
+    ***************************************************
+    * Tests for the filtered label totals begin here. *
+    ***************************************************
+    """
+    def _scan_table_statistics(self, row_category, descriptor):
+        detail_category = self._dataset._alternate_category_type(row_category)
+        value_list = [item[2] for item in self._dataset._data if
+                      item[row_category.value] == descriptor and
+                      item[detail_category.value] in
+                      self._dataset._active_labels[detail_category]]
+        if len(value_list) == 0:
+            return None, None, None
+        return min(value_list), sum(value_list) / len(value_list), max(value_list)
+
+    def _assert_table_statistics_match_scan(self):
+        for category in dataset.Categories:
+            for descriptor in self._dataset.get_labels(category):
+                self.assertEqual(self._dataset._table_statistics(category, descriptor),
+                                 self._scan_table_statistics(category, descriptor))
+
+    def test_table_statistics_match_scan_after_toggles(self):
+        self._dataset.load_default_data()
+        self._dataset.toggle_active_labels(dataset.Categories.LOCATION, "Manhattan")
+        self._dataset.toggle_active_labels(dataset.Categories.PROPERTY_TYPE, "Entire home/apt")
+        self._assert_table_statistics_match_scan()
+        self._dataset.toggle_active_labels(dataset.Categories.LOCATION, "Manhattan")
+        self._assert_table_statistics_match_scan()
+
+    def test_table_statistics_none_when_all_labels_inactive(self):
+        self._dataset.load_default_data()
+        for label in self._dataset.get_labels(dataset.Categories.PROPERTY_TYPE):
+            self._dataset.toggle_active_labels(dataset.Categories.PROPERTY_TYPE, label)
+        result = self._dataset._table_statistics(dataset.Categories.LOCATION, "Bronx")
+        self.assertEqual(result, (None, None, None))
+
+    """
+    *********************************************
+    * Tests for columnar storage begin from here.*
+    *********************************************
+    """
+    def test_columnar_rows_match_tuple_rows(self):
+        self._dataset.load_default_data()
+        columnar = dataset(storage=dataset.Storage.COLUMNAR)
+        columnar.load_default_data()
+        self.assertEqual(len(columnar._data), len(self._dataset._data))
+        self.assertEqual(columnar._data[10], self._dataset._data[10])
+        self.assertEqual(list(columnar._data), self._dataset._data)
+
+    def test_columnar_statistics_match_tuple_statistics(self):
+        self._dataset.load_default_data()
+        columnar = dataset(storage=dataset.Storage.COLUMNAR)
+        columnar.load_default_data()
+        for descriptor_one, descriptor_two in self._dataset._index:
+            self.assertEqual(
+                columnar._cross_table_statistics(descriptor_one, descriptor_two),
+                self._dataset._cross_table_statistics(descriptor_one, descriptor_two))
+        self.assertEqual(columnar.get_labels(dataset.Categories.LOCATION),
+                         self._dataset.get_labels(dataset.Categories.LOCATION))
+
+    """
+    ********************************************
+    * Tests for the streaming loader begin here.*
+    ********************************************
+    """
+    def test_iter_chunks_respects_chunk_size(self):
+        chunks = list(dataset.iter_chunks(chunk_size=10000))
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 48895)
+        self.assertTrue(all(len(chunk) <= 10000 for chunk in chunks))
+
+    def test_load_data_from_compressed_file_objects(self):
+        self._dataset.load_default_data()
+        with open('AB_NYC_2019.csv', 'rb') as csv_file:
+            raw = csv_file.read()
+        for compressed in (gzip.compress(raw), bz2.compress(raw)):
+            loaded = dataset()
+            loaded.load_data(io.BytesIO(compressed))
+            self.assertEqual(loaded._data, self._dataset._data)
+
+    def test_load_data_by_column_names_reports_progress(self):
+        source = io.StringIO("id,room_type,neighbourhood_group,price\n"
+                             "1,Private room,Bronx,40\n"
+                             "2,Shared room,Bronx,20\n"
+                             "3,Private room,Queens,60\n")
+        progress = []
+        self._dataset.load_data(source, columns=("neighbourhood_group", "room_type", "price"),
+                                chunk_size=2, progress=progress.append)
+        self.assertEqual(progress, [2, 3])
+        self.assertEqual(self._dataset._cross_table_statistics("Bronx", "Private room"),
+                         (40, 40, 40))
+        self.assertEqual(sorted(self._dataset.get_labels(dataset.Categories.LOCATION)),
+                         ["Bronx", "Queens"])
+
+    """
+    ********************************************
+    * Tests for sharded loading begin here.    *
+    ********************************************
+    """
+    def test_load_files_matches_single_file(self):
+        self._dataset.load_default_data()
+        with open('AB_NYC_2019.csv') as csv_file:
+            header, *lines = csv_file.read().splitlines()
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for shard in range(3):
+                path = os.path.join(directory, f"shard{shard}.csv")
+                with open(path, 'w') as shard_file:
+                    shard_file.write("\n".join([header] + lines[shard::3]) + "\n")
+                paths.append(path)
+            for workers in (1, 2):
+                sharded = dataset(storage=dataset.Storage.COLUMNAR)
+                sharded.load_files(paths, workers=workers)
+                self.assertEqual(len(sharded._data), len(self._dataset._data))
+                for descriptor_one, descriptor_two in self._dataset._index:
+                    self.assertEqual(
+                        sharded._cross_table_statistics(descriptor_one, descriptor_two),
+                        self._dataset._cross_table_statistics(descriptor_one, descriptor_two))
+                self.assertEqual(sharded._active_labels, self._dataset._active_labels)
+
+    """
+    ********************************************
+    * Tests for the binary cache begin here.   *
+    ********************************************
+    """
+    def test_cached_load_matches_parsed_load(self):
+        self._dataset.load_data('AB_NYC_2019.csv')
+        with tempfile.TemporaryDirectory() as directory:
+            path = shutil.copy('AB_NYC_2019.csv', directory)
+            for _ in range(2):
+                cached = dataset()
+                cached.load_data(path, cache=True)
+                self.assertTrue(os.path.exists(path + '.cache'))
+                self.assertEqual(cached._data, self._dataset._data)
+                self.assertEqual(cached._labels, self._dataset._labels)
+
+    def test_cache_rebuilt_when_file_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'listings.csv')
+            with open(path, 'w') as csv_file:
+                csv_file.write("id,neighbourhood_group,room_type,price\n1,Bronx,Private room,40\n")
+            self._dataset.load_data(path, cache=True)
+            with open(path, 'a') as csv_file:
+                csv_file.write("2,Queens,Shared room,25\n")
+            self._dataset.load_data(path, cache=True)
+            self.assertEqual(len(self._dataset._data), 2)
+            self.assertEqual(self._dataset._cross_table_statistics("Queens", "Shared room"),
+                             (25, 25, 25))
+
+    """
+    ********************************************
+    * Tests for the mmap scanner begin here.   *
+    ********************************************
+    """
+    def test_scan_file_matches_load_file(self):
+        expected = self._dataset.load_file()
+        self.assertEqual(list(dataset.scan_file('AB_NYC_2019.csv')), expected)
+        self.assertEqual(list(dataset.scan_file('AB_NYC_2019.csv', block_size=4096)),
+                         expected)
+
+    def test_scan_file_handles_quoted_fields(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'quoted.csv')
+            with open(path, 'w', newline='') as csv_file:
+                csv_file.write('id,name,neighbourhood_group,room_type,price\r\n'
+                               '1,"Big, bright\nloft",Bronx,"Private ""garden"" room",40\r\n'
+                               '\r\n'
+                               '2,Studio,Queens,Shared room,"25"\r\n')
+            rows = dataset.scan_file(path, columns=("neighbourhood_group", "room_type", "price"))
+        self.assertEqual(list(rows), [("Bronx", 'Private "garden" room', 40),
+                                      ("Queens", "Shared room", 25)])
+
+    def test_scan_file_rejects_rows_of_wrong_width(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ragged.csv')
+            with open(path, 'w', newline='') as csv_file:
+                csv_file.write('id,neighbourhood_group,room_type,price\n1,X,Y,5,6\n2,X,7\n')
+            with self.assertRaises(ValueError):
+                dataset.scan_file(path)
+
+    def test_scan_file_tells_long_labels_apart(self):
+        rows = [("Location 000000001", "Entire home/apt", 10),
+                ("Location 000000002", "Entire home/apt large", 1200),
+                ("Location 000000001", "Entire home", 7),
+                ("", "Entire home/apt", 10)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'labels.csv')
+            with open(path, 'w', newline='') as csv_file:
+                csv_file.write('id,neighbourhood_group,room_type,price\n'
+                               '1,Location 000000001,Entire home/apt,10\r\n'
+                               '2,Location 000000002,Entire home/apt large,1200\n'
+                               '3,Location 000000001,Entire home,7\r\n'
+                               '4,,Entire home/apt,10\n')
+            self.assertEqual(list(dataset.scan_file(path, block_size=1)), rows)
+            self.assertEqual(list(dataset.scan_file(path)), rows)
+            with open(path, 'w', newline='') as csv_file:
+                csv_file.write('id,price,room_type,neighbourhood_group\n'
+                               '1,5,Private room,Location 000000001\n2,6,Private room,')
+            self.assertEqual(list(dataset.scan_file(
+                path, columns=("neighbourhood_group", "room_type", "price"))),
+                [("Location 000000001", "Private room", 5), ("", "Private room", 6)])
+
+    """
+    ********************************************
+    * Tests for label ordering begin here.     *
+    ********************************************
+    """
+    def test_bubble_sort_orders_labels(self):
+        labels = ["Queens", "Bronx", "Staten Island", "Brooklyn", "Manhattan"]
+        self.assertEqual(dataset.bubble_sort(labels),
+                         ["Bronx", "Brooklyn", "Manhattan", "Queens", "Staten Island"])
+        self.assertEqual(labels[0], "Queens")
+
+    def test_bubble_sort_handles_many_labels(self):
+        labels = [f"label{number:04}" for number in range(3000, 0, -1)]
+        self.assertEqual(dataset.bubble_sort(labels), sorted(labels))
+
+    def test_sorted_labels_cached_on_load(self):
+        self._dataset.load_default_data()
+        for category in dataset.Categories:
+            self.assertEqual(self._dataset._sorted_labels[category],
+                             sorted(self._dataset.get_labels(category)))
+
+    """
+    ********************************************
+    * Tests for table rendering begin here.    *
+    ********************************************
+    """
+    def test_display_cross_table_writes_to_stream(self):
+        self._dataset.load_default_data()
+        out = io.StringIO()
+        self._dataset.display_cross_table(dataset.Stats.MAX, out=out)
+        lines = out.getvalue().split("\n")
+        self.assertEqual(len(lines), 7)
+        self.assertTrue(lines[1].startswith(" Bronx          $ "))
+        self.assertEqual(lines[-1], "")
+
+    def test_display_without_data_writes_message(self):
+        out = io.StringIO()
+        self._dataset.display_field_table(dataset.Categories.LOCATION, out=out)
+        self.assertEqual(out.getvalue(), "Please Add a data set first!\n")
+
+    def test_export_cross_table_csv(self):
+        self._dataset.load_default_data()
+        out = io.StringIO()
+        self._dataset.export_cross_table(dataset.Stats.MIN, out=out)
+        rows = list(csv.reader(io.StringIO(out.getvalue())))
+        self.assertEqual(rows[0], ["location", "Entire home/apt", "Private room", "Shared room"])
+        self.assertEqual(rows[1][0], "Bronx")
+        self.assertEqual(float(rows[1][2]),
+                         self._dataset._cross_table_statistics("Bronx", "Private room")[0])
+
+    def test_export_field_table_json(self):
+        self._dataset.load_default_data()
+        self._dataset.toggle_active_labels(dataset.Categories.PROPERTY_TYPE, "Shared room")
+        exported = json.loads(self._dataset.export_field_table(
+            dataset.Categories.LOCATION, dataset.ExportFormat.JSON))
+        self.assertEqual(exported["criteria"], ["Entire home/apt", "Private room"])
+        minimum, average, maximum = self._dataset._table_statistics(
+            dataset.Categories.LOCATION, "Queens")
+        self.assertEqual(exported["rows"]["Queens"],
+                         {"min": minimum, "avg": average, "max": maximum})
+
+    def test_manage_filters_writes_to_stream(self):
+        self._dataset.load_default_data()
+        out = io.StringIO()
+        with mock.patch('builtins.input', side_effect=["1", "9", "x"]), \
+                contextlib.redirect_stdout(io.StringIO()) as stdout:
+            manage_filters(self._dataset, dataset.Categories.PROPERTY_TYPE, out=out)
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertIn("Value entered not within range", out.getvalue())
+        self.assertIn("Please enter a number", out.getvalue())
+
+    """
+    ********************************************
+    * Tests for currency conversion begin here.*
+    ********************************************
+    """
+    def test_rate_matrix_is_consistent(self):
+        currencies, rates = rate_matrix()
+        for source_position, source in enumerate(currencies):
+            self.assertEqual(rates[source_position][source_position], 1)
+            for target_position, target in enumerate(currencies):
+                self.assertAlmostEqual(rates[source_position][target_position],
+                                       currency_converter(1, source, target))
+
+    def test_batch_conversion_matches_scalar(self):
+        amounts = [10, 25.5, 99]
+        for result in (currency_converter_batch(amounts, "GBP", "JPY"),
+                       currency_converter_batch(array('d', amounts), "GBP", "JPY")):
+            for amount, converted in zip(amounts, result):
+                self.assertAlmostEqual(converted, currency_converter(amount, "GBP", "JPY"))
+        self.assertIsInstance(currency_converter_batch(array('l', [1]), "USD", "EUR"), array)
+
+    def test_batch_conversion_validates_once(self):
+        with self.assertRaises(ValueError):
+            currency_converter_batch([10, 0, 5], "USD", "EUR")
+        with self.assertRaises(ValueError):
+            currency_converter_batch([10], "USD", "XYZ")
+        self.assertEqual(currency_converter_batch([], "USD", "EUR"), [])
+
+    def test_display_cross_table_in_other_currency(self):
+        self._dataset.load_default_data()
+        out = io.StringIO()
+        self._dataset.display_cross_table(dataset.Stats.MAX, out=out, currency="EUR")
+        bronx = out.getvalue().split("\n")[1]
+        expected = self._dataset._cross_table_statistics("Bronx", "Entire home/apt")[2] * .9
+        self.assertEqual(bronx[16:36], f"EUR {expected:<16.2f}")
+
+    """
+    ********************************************
+    * Tests for quantile statistics begin here.*
+    ********************************************
+    """
+    @staticmethod
+    def _exact_quantile(values, quantile):
+        values = sorted(values)
+        return values[int(quantile * (len(values) - 1))]
+
+    def test_cross_table_quantiles_within_one_percent(self):
+        self._dataset.load_default_data()
+        stats = {dataset.Stats.MEDIAN: .5, dataset.Stats.P90: .9, dataset.Stats.P99: .99}
+        for stat, quantile in stats.items():
+            property_labels, rows = self._dataset.cross_table(stat)
+            for location, values in rows:
+                for property_type, value in zip(property_labels, values):
+                    exact = self._exact_quantile(
+                        [item[2] for item in self._dataset._data
+                         if item[0] == location and item[1] == property_type], quantile)
+                    self.assertLessEqual(abs(value - exact), exact * .01)
+
+    def test_table_statistics_quantiles_follow_filters(self):
+        self._dataset.load_default_data()
+        self._dataset.toggle_active_labels(dataset.Categories.LOCATION, "Manhattan")
+        self._dataset.toggle_active_labels(dataset.Categories.LOCATION, "Brooklyn")
+        self._dataset.toggle_active_labels(dataset.Categories.LOCATION, "Brooklyn")
+        median, minimum = self._dataset._table_statistics(
+            dataset.Categories.PROPERTY_TYPE, "Private room",
+            (dataset.Stats.MEDIAN, dataset.Stats.MIN))
+        values = [item[2] for item in self._dataset._data
+                  if item[1] == "Private room" and item[0] != "Manhattan"]
+        exact = self._exact_quantile(values, .5)
+        self.assertLessEqual(abs(median - exact), exact * .01)
+        self.assertEqual(minimum, min(values))
+
+    def test_display_field_table_with_quantile_columns(self):
+        self._dataset.load_default_data()
+        out = io.StringIO()
+        self._dataset.display_field_table(dataset.Categories.PROPERTY_TYPE, out=out,
+                                          stats=(dataset.Stats.MEDIAN, dataset.Stats.P99))
+        lines = out.getvalue().split("\n")
+        self.assertIn(" " * 20 + "Median              99th Percentile ", lines)
+        self.assertTrue(lines[-2].startswith("Shared room         $ "))
+
+    """
+    ********************************************
+    * Tests for appending rows begin here.     *
+    ********************************************
+    """
+    def _all_tables(self, data_set):
+        tables = [data_set.cross_table(stat) for stat in dataset.Stats]
+        for category in dataset.Categories:
+            criteria, rows = data_set.field_table(category, stats=list(dataset.Stats))
+            tables.append((sorted(criteria), rows))
+        return tables
+
+    def test_append_rows_matches_full_reload(self):
+        self._dataset.load_default_data()
+        rows = self._dataset._data
+        for storage in dataset.Storage:
+            appended = dataset(storage=storage)
+            for start in range(0, len(rows), 7000):
+                appended.append_rows(rows[start:start + 7000])
+            self.assertEqual(self._all_tables(appended), self._all_tables(self._dataset))
+
+    def test_append_rows_keeps_filters_and_adds_new_labels(self):
+        self._dataset.load_default_data()
+        self._dataset.toggle_active_labels(dataset.Categories.LOCATION, "Bronx")
+        extra = [("Hoboken", "Private room", 80), ("Bronx", "Hotel room", 120)]
+        self._dataset.append_rows(extra)
+        reloaded = dataset()
+        reloaded.append_rows(self._dataset.load_file() + extra)
+        reloaded.toggle_active_labels(dataset.Categories.LOCATION, "Bronx")
+        self.assertEqual(self._all_tables(self._dataset), self._all_tables(reloaded))
+        self.assertNotIn("Bronx", self._dataset.get_active_labels(dataset.Categories.LOCATION))
+        self.assertIn("Hoboken", self._dataset.get_active_labels(dataset.Categories.LOCATION))
+
+    def test_ingest_stream(self):
+        self._dataset.load_default_data()
+        source = io.StringIO("id,neighbourhood_group,room_type,price\n"
+                             "1,Queens,Shared room,45\n"
+                             "2,Queens,Shared room,55\n")
+        self.assertEqual(self._dataset.ingest(source, chunk_size=1), 2)
+        self.assertEqual(len(self._dataset._data), 48897)
+
+    """
+    ********************************************
+    * Tests for concurrent access begin here.  *
+    ********************************************
+    """
+    def test_concurrent_readers_see_consistent_tables(self):
+        self._dataset.load_default_data()
+        category = dataset.Categories.LOCATION
+
+        def snapshot():
+            return (sorted(self._dataset.get_active_labels(category)),
+                    self._dataset.field_table(dataset.Categories.PROPERTY_TYPE,
+                                              stats=list(dataset.Stats))[1])
+
+        expected = [snapshot()]
+        self._dataset.toggle_active_labels(category, "Manhattan")
+        expected.append(snapshot())
+        self._dataset.toggle_active_labels(category, "Manhattan")
+        expected_tables = [table for _, table in expected]
+        failures = []
+        stop = threading.Event()
+
+        def read():
+            while not stop.is_set():
+                table = self._dataset.field_table(dataset.Categories.PROPERTY_TYPE,
+                                                  stats=list(dataset.Stats))[1]
+                if table not in expected_tables:
+                    failures.append(table)
+
+        def toggle():
+            while not stop.is_set():
+                self._dataset.toggle_active_labels(category, "Manhattan")
+
+        threads = [threading.Thread(target=read) for _ in range(6)]
+        threads.append(threading.Thread(target=toggle))
+        for thread in threads:
+            thread.start()
+        time.sleep(.5)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+
+    def test_readers_continue_during_slow_ingest(self):
+        self._dataset.load_default_data()
+
+        class SlowStream(io.StringIO):
+            def __next__(self):
+                time.sleep(.05)
+                return super().__next__()
+
+        source = SlowStream("id,neighbourhood_group,room_type,price\n" +
+                            "".join(f"{row},Queens,Shared room,45\n" for row in range(10)))
+        ingest = threading.Thread(target=self._dataset.ingest, args=(source,),
+                                  kwargs={"chunk_size": 1})
+        ingest.start()
+        time.sleep(.1)
+        start = time.perf_counter()
+        self._dataset.get_labels(dataset.Categories.LOCATION)
+        waited = time.perf_counter() - start
+        ingest.join()
+        self.assertLess(waited, .2)
+        self.assertEqual(len(self._dataset._data), 48905)
+
+    def test_write_lock_waits_for_readers(self):
+        self._dataset.load_default_data()
+        events = []
+        reading = threading.Event()
+
+        def slow_read():
+            self._dataset._lock.acquire_read()
+            reading.set()
+            time.sleep(.1)
+            events.append("read done")
+            self._dataset._lock.release_read()
+
+        reader = threading.Thread(target=slow_read)
+        reader.start()
+        reading.wait()
+        self._dataset.toggle_active_labels(dataset.Categories.LOCATION, "Bronx")
+        events.append("toggled")
+        reader.join()
+        self.assertEqual(events, ["read done", "toggled"])
+
+    """
+    ********************************************
+    * Tests for the report service begin here. *
+    ********************************************
+    """
+
+    def test_service_reports_need_data(self):
+        service = ReportService(self._dataset)
+        response = asyncio.run(service.handle({"action": "cross_table", "stat": "AVG"}))
+        self.assertEqual(response, {"ok": False, "error": "Please Load a Dataset First!!"})
+        response = asyncio.run(service.handle({"action": "nonsense"}))
+        self.assertFalse(response["ok"])
+
+    def test_service_matches_dataset(self):
+        self._dataset.load_default_data()
+        service = ReportService(self._dataset)
+        response = asyncio.run(service.handle({"action": "cross_table", "stat": "MAX"}))
+        columns, rows = self._dataset.cross_table(dataset.Stats.MAX)
+        self.assertEqual(response["result"], {"columns": columns, "rows": rows})
+        out = io.StringIO()
+        self._dataset.display_field_table(dataset.Categories.LOCATION, out=out)
+        response = asyncio.run(service.handle({"action": "field_table", "category": "location",
+                                               "format": "text"}))
+        self.assertEqual(response["result"], out.getvalue())
+        response = asyncio.run(service.handle({"action": "toggle_filter",
+                                               "category": "LOCATION", "label": "Bronx"}))
+        self.assertNotIn("Bronx", response["result"]["active"])
+        response = asyncio.run(service.handle({"action": "toggle_filter",
+                                               "category": "LOCATION", "label": "Nowhere"}))
+        self.assertFalse(response["ok"])
+        response = asyncio.run(service.handle({"action": "convert_currency", "amount": 10,
+                                               "source": "USD", "target": "EUR"}))
+        self.assertAlmostEqual(response["result"], 9)
+
+    def test_service_serves_reports_during_load(self):
+        self._dataset.load_default_data()
+        service = ReportService(self._dataset)
+
+        async def exchange():
+            server = await service.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            connections = [await asyncio.open_connection("127.0.0.1", port) for _ in range(3)]
+
+            async def send(connection, payload):
+                reader, writer = connection
+                writer.write(json.dumps(payload).encode() + b"\n")
+                await writer.drain()
+                return json.loads(await reader.readline())
+
+            load = asyncio.ensure_future(send(connections[0], {"action": "load"}))
+            reports = await asyncio.gather(
+                send(connections[1], {"action": "labels", "category": "LOCATION"}),
+                send(connections[2], {"action": "cross_table", "stat": "MIN"}))
+            loaded = await load
+            for _, writer in connections:
+                writer.close()
+            server.close()
+            await server.wait_closed()
+            return reports, loaded
+
+        reports, loaded = asyncio.run(exchange())
+        self.assertTrue(all(report["ok"] for report in reports))
+        self.assertEqual(loaded["result"], {"rows": 48895})
+        self.assertIsNot(service.dataset, self._dataset)
+
+    def test_service_loads_only_data_files_and_keeps_price_range(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shutil.copy('AB_NYC_2019.csv', directory)
+        self._dataset.load_default_data()
+        self._dataset.set_price_range(50, 150)
+        service = ReportService(self._dataset, data_directory=directory)
+        for path in [os.path.abspath('AB_NYC_2019.csv'), '../AB_NYC_2019.csv']:
+            response = asyncio.run(service.handle({"action": "load", "path": path}))
+            self.assertFalse(response["ok"])
+        self.assertIs(service.dataset, self._dataset)
+        response = asyncio.run(service.handle({"action": "load", "path": "AB_NYC_2019.csv"}))
+        self.assertEqual(response["result"], {"rows": 48895})
+        self.assertTrue(os.path.exists(os.path.join(directory, 'AB_NYC_2019.csv.cache')))
+        self.assertEqual(service.dataset.get_price_range(), (50, 150))
+
+    def test_service_writes_do_not_stall_other_clients(self):
+        self._dataset.load_default_data()
+        service = ReportService(self._dataset)
+        reading = threading.Event()
+
+        def slow_read():
+            self._dataset._lock.acquire_read()
+            reading.set()
+            time.sleep(.3)
+            self._dataset._lock.release_read()
+
+        async def exchange():
+            reader = threading.Thread(target=slow_read)
+            reader.start()
+            reading.wait()
+            toggle = asyncio.ensure_future(service.handle(
+                {"action": "toggle_filter", "category": "LOCATION", "label": "Bronx"}))
+            start = time.perf_counter()
+            await asyncio.sleep(.05)
+            await service.handle({"action": "convert_currency", "amount": 10,
+                                  "source": "USD", "target": "EUR"})
+            waited = time.perf_counter() - start
+            toggled = await toggle
+            reader.join()
+            return waited, toggled
+
+        waited, toggled = asyncio.run(exchange())
+        self.assertLess(waited, .15)
+        self.assertNotIn("Bronx", toggled["result"]["active"])
+
+    """
+    ********************************************
+    * Tests for the result cache begin here.   *
+    ********************************************
+    """
+
+    def test_result_cache_hits_repeated_views(self):
+        self._dataset.load_default_data()
+        first, second = io.StringIO(), io.StringIO()
+        self._dataset.display_cross_table(dataset.Stats.AVG, out=first)
+        misses = self._dataset.cache_info()["misses"]
+        self._dataset.display_cross_table(dataset.Stats.AVG, out=second)
+        info = self._dataset.cache_info()
+        self.assertEqual(first.getvalue(), second.getvalue())
+        self.assertEqual(info["misses"], misses)
+        self.assertEqual(info["hits"], 1)
+
+    def test_cached_tables_are_immutable(self):
+        self._dataset.load_default_data()
+        columns, rows = self._dataset.cross_table(dataset.Stats.MAX)
+        criteria, field_rows = self._dataset.field_table(dataset.Categories.LOCATION)
+        for value in (columns, rows, rows[0][1], criteria, field_rows, field_rows[0][1]):
+            self.assertIsInstance(value, tuple)
+        self._dataset.append_rows([("Bronx", "Hotel room", 120)])
+        self.assertEqual(columns, ("Entire home/apt", "Private room", "Shared room"))
+        self.assertEqual(self._dataset._sorted_labels[dataset.Categories.PROPERTY_TYPE],
+                         ["Entire home/apt", "Hotel room", "Private room", "Shared room"])
+
+    def test_result_cache_follows_filters(self):
+        self._dataset.load_default_data()
+        category = dataset.Categories.PROPERTY_TYPE
+        before = self._dataset.field_table(dataset.Categories.LOCATION)
+        self._dataset.toggle_active_labels(category, "Private room")
+        toggled = self._dataset.field_table(dataset.Categories.LOCATION)
+        self.assertNotEqual(before, toggled)
+        self._dataset.toggle_active_labels(category, "Private room")
+        hits = self._dataset.cache_info()["hits"]
+        self.assertEqual(self._dataset.field_table(dataset.Categories.LOCATION), before)
+        self.assertEqual(self._dataset.cache_info()["hits"], hits + 1)
+
+    def test_result_cache_dropped_on_data_change(self):
+        self._dataset.load_default_data()
+        before = self._dataset.cross_table(dataset.Stats.MAX)
+        self._dataset.append_rows([("Bronx", "Shared room", 99999)])
+        self.assertEqual(self._dataset.cache_info()["size"], 0)
+        after = self._dataset.cross_table(dataset.Stats.MAX)
+        self.assertNotEqual(before, after)
+        self._dataset.load_default_data()
+        self.assertEqual(self._dataset.cross_table(dataset.Stats.MAX), before)
+
+    def test_result_cache_is_bounded(self):
+        self._dataset.load_default_data()
+        self._dataset.result_cache_size = 2
+        for stat in dataset.Stats:
+            self._dataset.cross_table(stat)
+        self.assertEqual(self._dataset.cache_info()["size"], 2)
+
+    """
+    ********************************************
+    * Tests for instrumentation begin here.    *
+    ********************************************
+    """
+
+    def test_instrumentation_records_operations(self):
+        instrumentation = self._dataset.enable_instrumentation(memory=True)
+        self._dataset.load_default_data()
+        for _ in range(2):
+            self._dataset.display_cross_table(dataset.Stats.AVG, out=io.StringIO())
+        self._dataset.disable_instrumentation()
+        self._dataset.display_cross_table(dataset.Stats.MIN, out=io.StringIO())
+        stats = instrumentation.stats
+        self.assertEqual(stats["load_data"].rows, 48895)
+        self.assertGreater(stats["load_data"].peak_bytes, 0)
+        self.assertEqual(stats["display_cross_table"].calls, 2)
+        self.assertEqual(stats["display_cross_table"].cache_hits, 1)
+        self.assertEqual(stats["render_cross_table"].calls, 1)
+        self.assertIsNone(stats["render_cross_table"].peak_bytes)
+        out = io.StringIO()
+        instrumentation.report(out)
+        self.assertIn("display_cross_table", out.getvalue())
+
+    def test_instrumentation_profile(self):
+        self._dataset.load_default_data()
+        instrumentation = self._dataset.enable_instrumentation(profile=True)
+        self._dataset.field_table(dataset.Categories.LOCATION)
+        out = io.StringIO()
+        instrumentation.dump_profile(out=out)
+        self.assertIn("_compute_field_table", out.getvalue())
+        with self.assertRaises(ValueError):
+            self._dataset.enable_instrumentation().dump_profile(out=out)
+
+    """
+    ********************************************
+    * Tests for interned rows begin here.      *
+    ********************************************
+    """
+
+    def test_loaded_rows_share_equal_tuples(self):
+        rows = self._dataset.load_file()
+        with open('AB_NYC_2019.csv', newline='') as csv_file:
+            expected = [(line[1], line[2], int(line[3])) for line in list(csv.reader(csv_file))[1:]]
+        self.assertEqual(rows, expected)
+        self.assertLess(len(set(map(id, rows))), 5000)
+        self.assertEqual(len({id(row[0]) for row in rows}), 5)
+        first = next(row for row in rows[1:] if row == rows[0])
+        self.assertIs(first, rows[0])
+
+    def test_row_storage_shares_equal_tuples(self):
+        self._dataset.load_data('AB_NYC_2019.csv')
+        self.assertEqual(self._dataset._data, self._dataset.load_file())
+        self.assertLess(len(set(map(id, self._dataset._data))), 5000)
+
+    """
+    ********************************************
+    * Tests for the aggregate cube begin here. *
+    ********************************************
+    """
+
+    def test_cube_matches_dataset_tables(self):
+        self._dataset.load_default_data()
+        self._dataset.toggle_active_labels(dataset.Categories.LOCATION, "Queens")
+        cube = self._dataset.cube()
+        for stat in dataset.Stats:
+            self.assertEqual(cube.cross_table("LOCATION", "PROPERTY_TYPE", stat),
+                             self._dataset.cross_table(stat))
+        for category in dataset.Categories:
+            self.assertEqual(cube.field_table(category.name, list(dataset.Stats))[1],
+                             self._dataset.field_table(category, stats=list(dataset.Stats))[1])
+
+    def test_cube_filters_on_other_dimensions(self):
+        def band(price):
+            return "cheap" if int(price) < 100 else "dear"
+
+        cube = AggregateCube.from_csv('AB_NYC_2019.csv',
+                                      {"LOCATION": "neighbourhood_group",
+                                       "PROPERTY_TYPE": "room_type", "BAND": "price"},
+                                      buckets={"BAND": band})
+        cube.toggle_active_labels("PROPERTY_TYPE", "Private room")
+        with open('AB_NYC_2019.csv', newline='') as csv_file:
+            rows = [line for line in list(csv.reader(csv_file))[1:] if line[2] != "Private room"]
+        columns, table = cube.cross_table("BAND", "LOCATION", dataset.Stats.MAX)
+        for band_label, values in table:
+            for location, value in zip(columns, values):
+                prices = [int(line[3]) for line in rows
+                          if line[1] == location and band(line[3]) == band_label]
+                self.assertEqual(value, max(prices))
+        criteria, table = cube.field_table("BAND", [dataset.Stats.MIN])
+        self.assertNotIn("Private room", criteria["PROPERTY_TYPE"])
+        self.assertEqual(table, (("cheap", (min(int(line[3]) for line in rows),)),
+                                 ("dear", (100,))))
+        with self.assertRaises(KeyError):
+            cube.toggle_active_labels("BAND", "free")
+
+    def test_cube_rolls_up_from_finer_cells(self):
+        cube = AggregateCube(("A", "B", "C"))
+        cube.add_rows([("a1", "b1", "c1", 10), ("a1", "b2", "c1", 20), ("a2", "b1", "c2", 30)])
+        self.assertEqual(cube.rollup(("B", "A"))[("b1", "a1")].total, 10)
+        self.assertEqual(cube.rollup(("A",))[("a1",)].count, 2)
+        self.assertEqual(sorted(cube._rollups), [(0,), (0, 1)])
+        cube.add_rows([("a1", "b3", "c3", 5)])
+        self.assertEqual(cube.rollup(("A",))[("a1",)].minimum, 5)
+        self.assertIn("b3", cube.get_active_labels("B"))
+
+    """
+    ********************************************
+    * Tests for price ranges begin here.       *
+    ********************************************
+    """
+
+    def _rows_in_range(self, low, high):
+        with open('AB_NYC_2019.csv', newline='') as csv_file:
+            return [(line[1], line[2], int(line[3])) for line in list(csv.reader(csv_file))[1:]
+                    if low <= int(line[3]) <= high]
+
+    def test_price_range_statistics(self):
+        self._dataset.load_default_data()
+        prices = [price for location, _, price in self._rows_in_range(100, 200)
+                  if location == "Bronx"]
+        self.assertEqual(self._dataset.price_range_statistics(100, 200, location="Bronx"),
+                         (len(prices), min(prices), sum(prices) / len(prices), max(prices)))
+        self.assertEqual(self._dataset.price_range_statistics(high=-1), (0, None, None, None))
+        self.assertEqual(self._dataset.price_range_statistics()[0], 48895)
+
+    def test_price_range_filters_tables(self):
+        self._dataset.load_default_data()
+        self._dataset.toggle_active_labels(dataset.Categories.PROPERTY_TYPE, "Shared room")
+        self._dataset.set_price_range(50, 150)
+        rows = self._rows_in_range(50, 150)
+        table = self._dataset.field_table(dataset.Categories.LOCATION,
+                                          stats=list(dataset.Stats))[1]
+        for location, values in table:
+            prices = sorted(price for row_location, property_type, price in rows
+                            if row_location == location and property_type != "Shared room")
+            self.assertEqual(values, (prices[0], sum(prices) / len(prices), prices[-1],
+                                      prices[int(.5 * (len(prices) - 1))],
+                                      prices[int(.9 * (len(prices) - 1))],
+                                      prices[int(.99 * (len(prices) - 1))]))
+        self.assertEqual(self._dataset._cross_table_statistics("Bronx", "Shared room")[0], 50)
+        out = io.StringIO()
+        self._dataset.display_field_table(dataset.Categories.LOCATION, out=out)
+        self.assertIn("- Price from 50 to 150 USD", out.getvalue())
+        self._dataset.set_price_range()
+        self.assertEqual(self._dataset._cross_table_statistics("Bronx", "Shared room")[0], 20)
+        with self.assertRaises(ValueError):
+            self._dataset.set_price_range(10, 5)
+
+    def test_service_rejects_price_bounds_that_are_not_numbers(self):
+        self._dataset.load_default_data()
+        service = ReportService(self._dataset)
+        for bounds in [{"low": "50"}, {"high": True}, {"low": float("nan")}, {"high": [1]}]:
+            response = asyncio.run(service.handle({"action": "price_range", **bounds}))
+            self.assertFalse(response["ok"])
+        self.assertIsNone(self._dataset.get_price_range())
+        response = asyncio.run(service.handle({"action": "cross_table", "stat": "AVG"}))
+        self.assertTrue(response["ok"])
+        response = asyncio.run(service.handle({"action": "price_range", "low": 50.5}))
+        self.assertEqual(response["result"], {"price_range": (50.5, None)})
+
+    def test_price_index_merges_appended_rows(self):
+        rows = self._dataset.load_file()
+        for storage in dataset.Storage:
+            appended = dataset(storage=storage)
+            appended.append_rows(rows[:30000])
+            appended.append_rows(rows[30000:] + [("Bronx", "Hotel room", 120)])
+            # Appended prices wait to be merged until the index is read.
+            self.assertIsNotNone(appended._price_index[("Bronx", "Private room")]._state[2])
+            reloaded = dataset(storage=storage)
+            reloaded.append_rows(rows + [("Bronx", "Hotel room", 120)])
+            self.assertEqual(sorted((key, list(index.prices), list(index.sums))
+                                    for key, index in appended._price_index.items()),
+                             sorted((key, list(index.prices), list(index.sums))
+                                    for key, index in reloaded._price_index.items()))
+            self.assertEqual(appended.price_range_statistics(100, 120, "Bronx"),
+                             reloaded.price_range_statistics(100, 120, "Bronx"))
+
+    """
+    ********************************************
+    * Tests for extreme listings begin here.   *
+    ********************************************
+    """
+
+    def test_extreme_listings_match_sorted_prices(self):
+        self._dataset.load_default_data()
+        with open('AB_NYC_2019.csv', newline='') as csv_file:
+            rows = list(csv.reader(csv_file))[1:]
+        groups = self._dataset.extreme_listings(3)
+        self.assertEqual(len(groups), len(self._dataset._index))
+        for (location, property_type), top, bottom in groups:
+            listings = {line[0]: int(line[3]) for line in rows
+                        if line[1] == location and line[2] == property_type}
+            prices = sorted(listings.values())
+            self.assertEqual([price for _, price in top], prices[::-1][:3])
+            self.assertEqual([price for _, price in bottom], prices[:3])
+            for listing_id, price in top + bottom:
+                self.assertEqual(listings[listing_id], price)
+
+    def test_extreme_listings_follow_filters(self):
+        self._dataset.load_default_data()
+        self._dataset.toggle_active_labels(dataset.Categories.LOCATION, "Bronx")
+        self._dataset.set_price_range(100, 200)
+        groups = self._dataset.extreme_listings(2)
+        self.assertNotIn("Bronx", [location for (location, _), _, _ in groups])
+        for _, top, bottom in groups:
+            self.assertTrue(all(100 <= price <= 200 for _, price in top + bottom))
+        out = io.StringIO()
+        self._dataset.display_extreme_listings(2, out=out)
+        self.assertIn("Manhattan - Private room", out.getvalue())
+        self._dataset.append_rows([("Bronx", "Private room", 5)])
+        with self.assertRaises(ValueError):
+            self._dataset.extreme_listings()
+
+    def test_extreme_listings_follow_appended_rows(self):
+        self._dataset.load_default_data()
+        cached = dataset()
+        cached.load_default_data()
+        self.assertEqual(cached.extreme_listings(), self._dataset.extreme_listings())
+        self._dataset.append_rows([("Bronx", "Private room", -1)], ids=["new"])
+        self._dataset.append_rows([("Bronx", "Private room", -2)])
+        self._dataset.ingest(io.StringIO("id,neighbourhood_group,room_type,price\n"
+                                         "7,Bronx,Private room,99999\n"))
+        groups = {key: (top, bottom) for key, top, bottom in self._dataset.extreme_listings()}
+        top, bottom = groups[("Bronx", "Private room")]
+        self.assertEqual(top[0], ("7", 99999))
+        self.assertEqual(bottom[:2], [(None, -2), ("new", -1)])
+        with self.assertRaises(ValueError):
+            self._dataset.extreme_listings(DEFAULT_LISTING_COUNT + 1)
+        with self.assertRaises(ValueError):
+            self._dataset.append_rows([("Bronx", "Private room", 1)], ids=[])
+
+    def test_extreme_listings_rescan_checks_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shutil.copy('AB_NYC_2019.csv', directory)
+        cwd = os.getcwd()
+        os.chdir(directory)
+        self.addCleanup(os.chdir, cwd)
+        self._dataset.load_files(['AB_NYC_2019.csv'], workers=1)
+        os.chdir(cwd)
+        self._dataset.set_price_range(100, 200)
+        in_range = self._dataset.extreme_listings(2)
+        self.assertTrue(all(100 <= price <= 200 for _, top, bottom in in_range
+                            for _, price in top + bottom))
+        with open(os.path.join(directory, 'AB_NYC_2019.csv'), 'a') as csv_file:
+            csv_file.write("1,Bronx,Private room,150\n")
+        with self.assertRaises(ValueError):
+            self._dataset.extreme_listings(3)
+
+    def test_extreme_listings_reject_k_below_one(self):
+        self._dataset.load_default_data()
+        service = ReportService(self._dataset)
+        for price_range in [(None, None), (100, 200)]:
+            self._dataset.set_price_range(*price_range)
+            for k in [0, -1]:
+                with self.assertRaises(ValueError):
+                    self._dataset.extreme_listings(k)
+                response = asyncio.run(service.handle({"action": "listings", "k": k}))
+                self.assertEqual(response, {"ok": False, "error": "k must be at least 1"})
+
+    """
+    ********************************************
+    * Tests for background loading begin here. *
+    ********************************************
+    """
+
+    def test_prefetch_loads_in_background(self):
+        prefetch = _Prefetch(self._dataset)
+        out = io.StringIO()
+        prefetch.wait(out)
+        self.assertEqual(len(self._dataset._data), 48895)
+        self.assertEqual(prefetch.rows, 48895)
+        self.assertNotIn("failed", out.getvalue())
+
+    def test_load_reports_progress_within_the_file(self):
+        counts = []
+        self._dataset.load_data('AB_NYC_2019.csv', progress=counts.append)
+        self.assertGreater(len(counts), 2)
+        self.assertEqual(counts, sorted(counts))
+        self.assertEqual(counts[-1], 48895)
+
+    def test_prefetch_reports_failure_once(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cwd = os.getcwd()
+        os.chdir(directory)
+        self.addCleanup(os.chdir, cwd)
+        prefetch = _Prefetch(self._dataset)
+        out = io.StringIO()
+        prefetch.wait(out)
+        prefetch.wait(out)
+        self.assertEqual(out.getvalue().count("Loading the data failed"), 1)
+        self.assertIsNone(self._dataset._data)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,24 @@
 '''A simple  calculator module for learning tdd in python.'''
 
+import ast
+import operator
+import sys
+from array import array
+from functools import lru_cache
+from itertools import repeat
+
+
+@lru_cache(maxsize=None)
+def _numpy():
+    '''Returns the numpy module, imported on first use so that importing
+    calc does not wait for it, or None if it is not installed.'''
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
 def add(x,y):
     '''Add function'''
     return x + y
@@ -20,3 +39,185 @@ def devide(x,y):
     if y == 0:
         raise ValueError('Can not devide by zero!')
     return x / y
+
+
+def _is_ndarray(value):
+    # No value can be an ndarray before something has imported numpy.
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def _is_float_array(value):
+    return isinstance(value, array) and value.typecode == 'd'
+
+
+def _is_sequence(value):
+    return isinstance(value, (list, tuple, range, array)) or _is_ndarray(value)
+
+
+def _broadcast(operands):
+    '''Returns the operands as iterables of one common length, repeating
+    scalars and sequences of length 1, and that length (None if every
+    operand is a scalar).'''
+    lengths = {len(value) for value in operands if _is_sequence(value)}
+    lengths.discard(1)
+    if len(lengths) > 1:
+        raise ValueError('Operands could not be broadcast together')
+    if not lengths:
+        lengths = {1} if any(_is_sequence(value) for value in operands) else {None}
+    length = lengths.pop()
+    if length is None:
+        return operands, None
+    return [value if _is_sequence(value) and len(value) == length
+            else repeat(value[0] if _is_sequence(value) else value, length)
+            for value in operands], length
+
+
+def _result(values, operands):
+    '''Returns values as an array of floats if an operand was an array.array,
+    and as a list otherwise.'''
+    if any(isinstance(value, array) for value in operands):
+        return array('d', values)
+    return list(values)
+
+
+def _batch(operation, x, y):
+    '''Apply operation to x and y element by element. NumPy arrays are
+    handled by NumPy itself, and other sequences by one map() call.'''
+    if _is_ndarray(x) or _is_ndarray(y):
+        np = _numpy()
+        return operation(np.asarray(x), np.asarray(y))
+    (xs, ys), length = _broadcast((x, y))
+    if length is None:
+        return operation(x, y)
+    return _result(map(operation, xs, ys), (x, y))
+
+
+def add_batch(x,y):
+    '''Add function over sequences, array.array or NumPy arrays, and scalars'''
+    return _batch(operator.add, x, y)
+
+
+def subtract_batch(x,y):
+    '''Subtraction function over sequences, array.array or NumPy arrays, and scalars'''
+    return _batch(operator.sub, x, y)
+
+
+def multiply_batch(x,y):
+    '''Multiply function over sequences, array.array or NumPy arrays, and scalars'''
+    return _batch(operator.mul, x, y)
+
+
+def _has_zero(y):
+    if _is_ndarray(y):
+        return bool((y == 0).any())
+    if _is_sequence(y):
+        return 0 in y
+    return y == 0
+
+
+def devide_batch(x,y):
+    '''Division function over sequences, array.array or NumPy arrays, and
+    scalars. Raises ValueError, as devide does, if any divisor is zero.'''
+    if _has_zero(y):
+        raise ValueError('Can not devide by zero!')
+    return _batch(operator.truediv, x, y)
+
+
+def _devide_values(x, y):
+    '''Division used by compiled expressions, for scalars and NumPy arrays.'''
+    if _has_zero(y):
+        raise ValueError('Can not devide by zero!')
+    return x / y
+
+
+_OPERATORS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*'}
+_UNARY_OPERATORS = {ast.UAdd: '+', ast.USub: '-'}
+
+
+def _translate(node, parameters, division):
+    '''Returns Python source for an expression node, with divisions turned
+    into calls of the function named division and each variable name
+    replaced by its parameter in the dict parameters. Anything but numbers,
+    names, + - * / and parentheses is a ValueError.'''
+    if isinstance(node, ast.BinOp) and (type(node.op) in _OPERATORS or
+                                        isinstance(node.op, ast.Div)):
+        left = _translate(node.left, parameters, division)
+        right = _translate(node.right, parameters, division)
+        if isinstance(node.op, ast.Div):
+            return f'{division}({left}, {right})'
+        return f'({left} {_OPERATORS[type(node.op)]} {right})'
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        operand = _translate(node.operand, parameters, division)
+        return f'({_UNARY_OPERATORS[type(node.op)]}{operand})'
+    if isinstance(node, ast.Name):
+        return parameters[node.id]
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return repr(node.value)
+    raise ValueError(f'Unsupported expression: {ast.unparse(node)}')
+
+
+class Expression(object):
+    '''A formula such as (a + b) * c / d, parsed and compiled once and then
+    evaluated over scalars or whole columns.'''
+
+    def __init__(self, text):
+        try:
+            tree = ast.parse(text.strip(), mode='eval')
+        except SyntaxError:
+            raise ValueError(f'Invalid expression: {text}')
+        self.text = text
+        self.names = tuple(sorted({node.id for node in ast.walk(tree.body)
+                                   if isinstance(node, ast.Name)}))
+        # The generated code names the variables _0, _1, ... in the order of
+        # self.names, so no variable can shadow the division helpers.
+        parameters = {name: f'_{index}' for index, name in enumerate(self.names)}
+        arguments = ', '.join(parameters.values())
+        scope = {'__builtins__': {}, '_devide_values': _devide_values, 'devide': devide}
+        # One version for whole NumPy columns and a leaner one for single values.
+        self._function = eval(
+            f'lambda {arguments}: {_translate(tree.body, parameters, "_devide_values")}', scope)
+        self._scalar_function = eval(
+            f'lambda {arguments}: {_translate(tree.body, parameters, "devide")}', scope)
+
+    def __call__(self, /, **values):
+        '''Evaluate the formula with a value for each of its names. When a
+        value is a NumPy ndarray, columns are evaluated as whole arrays,
+        giving an ndarray, and so are array('d') columns with NumPy
+        installed, giving an array of floats. Other columns, which may hold
+        Python ints that must not overflow, are evaluated row by row with
+        the compiled formula, one call per row, giving a list or, for
+        array.array inputs, an array of floats. Any zero divisor raises
+        ValueError.'''
+        missing = [name for name in self.names if name not in values]
+        if missing:
+            raise ValueError(f'Missing values for: {", ".join(missing)}')
+        operands = [values[name] for name in self.names]
+        if any(_is_ndarray(value) for value in operands):
+            np = _numpy()
+            return self._function(*(np.asarray(value) if _is_sequence(value) else value
+                                    for value in operands))
+        columns, length = _broadcast(operands)
+        if length is None:
+            return self._scalar_function(*operands)
+        if all(_is_float_array(value) or not _is_sequence(value) for value in operands):
+            np = _numpy()
+            if np is not None:
+                result = self._function(*(np.frombuffer(value, dtype=np.float64)
+                                          if _is_sequence(value) else value
+                                          for value in operands))
+                return array('d', np.broadcast_to(result, (length,)).astype(np.float64)
+                             .tobytes())
+        return _result(map(self._scalar_function, *columns), operands)
+
+
+@lru_cache(maxsize=128)
+def compile_expression(text):
+    '''Returns the Expression for text, parsing and compiling it only the
+    first time the same text is seen'''
+    return Expression(text)
+
+
+def evaluate(text, /, **values):
+    '''Evaluate a formula over the given values, see Expression'''
+    return compile_expression(text)(**values)
@@ -1,5 +1,10 @@
 import unittest
+from array import array
 from calc import add, subtract, multiply, devide
+from calc import add_batch, subtract_batch, multiply_batch, devide_batch
+from calc import compile_expression, evaluate, _numpy
+
+np = _numpy()
 
 class Calc_test(unittest.TestCase):
     def test_add(self):
@@ -18,6 +23,60 @@ class Calc_test(unittest.TestCase):
         result = devide(6, 3)
         self.assertEqual(result, 2)
 
+    def test_batch(self):
+        self.assertEqual(add_batch([6, 1], 3), [9, 4])
+        self.assertEqual(subtract_batch(6, (3, 1)), [3, 5])
+        self.assertEqual(multiply_batch(array('l', [6, 1]), [3]), array('d', [18, 3]))
+        self.assertEqual(devide_batch([6, 1], [3, 4]), [2, 0.25])
+        self.assertEqual(add_batch(6, 3), 9)
+
+    def test_batch_checks_every_divisor(self):
+        with self.assertRaises(ValueError):
+            devide_batch([6, 1], [3, 0])
+        with self.assertRaises(ValueError):
+            add_batch([1, 2], [1, 2, 3])
+
+    @unittest.skipIf(np is None, 'NumPy is not installed')
+    def test_batch_numpy(self):
+        result = devide_batch(np.array([6, 1]), np.array([[3], [1]]))
+        self.assertEqual(result.tolist(), [[2, 1 / 3], [6, 1]])
+        with self.assertRaises(ValueError):
+            devide_batch(np.arange(3), np.arange(3))
+
+    def test_expression(self):
+        expression = compile_expression('(a + b) * c / d')
+        self.assertIs(compile_expression('(a + b) * c / d'), expression)
+        self.assertEqual(expression.names, ('a', 'b', 'c', 'd'))
+        self.assertEqual(expression(a=1, b=2, c=3, d=4), 2.25)
+        self.assertEqual(evaluate('(a + b) * c / d', a=[1, 2], b=3, c=[2, 4], d=2), [4, 10])
+        self.assertEqual(evaluate('-x * 2', x=array('d', [1, 2])), array('d', [-2, -4]))
+        with self.assertRaises(ValueError):
+            evaluate('a / (b - 1)', a=[1, 2], b=[2, 1])
+        with self.assertRaises(ValueError):
+            evaluate('a / b', a=1)
+
+    def test_expression_keeps_python_ints(self):
+        self.assertEqual(evaluate('a * b', a=[10**10], b=(10**10,)), [10**20])
+        self.assertEqual(evaluate('a * b + 1', a=[2**62, 1], b=4), [2**64 + 1, 5])
+
+    def test_expression_names_do_not_shadow_helpers(self):
+        self.assertEqual(evaluate('devide / 2', devide=4), 2)
+        self.assertEqual(evaluate('_devide_values / _0', _devide_values=[3], _0=2), [1.5])
+        self.assertEqual(evaluate('text - self', text=3, self=1), 2)
+
+    @unittest.skipIf(np is None, 'NumPy is not installed')
+    def test_expression_float_arrays(self):
+        result = evaluate('(a + b) / c', a=array('d', [1, 2, 3]), b=1, c=array('d', [2]))
+        self.assertEqual(result, array('d', [1, 1.5, 2]))
+        self.assertEqual(evaluate('a * 1', a=array('d', [5])), array('d', [5]))
+        with self.assertRaises(ValueError):
+            evaluate('a / b', a=array('d', [1, 2]), b=array('d', [1, 0]))
+
+    def test_expression_rejects_other_syntax(self):
+        for text in ['a ** 2', 'f(a)', 'a.real', 'a +']:
+            with self.assertRaises(ValueError):
+                compile_expression(text)
+
 '''Without "if __name__==__main__ " we run the module as below:'''
 # python3 -m unittest test_calc.py
 